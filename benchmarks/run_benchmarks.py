@@ -0,0 +1,389 @@
+#!/usr/bin/python3
+"""Time the hot paths against synthetic data and save the results as JSON.
+
+    python benchmarks/run_benchmarks.py --states 56 --days 365 --output before.json
+    python benchmarks/run_benchmarks.py --compare before.json
+
+Every benchmark runs in a temporary directory filled by synthetic_data.py, so nothing depends on
+upstream or on the data/ directory of the checkout. Each result is the time of one call in seconds
+(min, median and mean over the repeats)."""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import warnings
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+import numpy
+
+from covid import build_graphs
+from covid import calculate_trends
+from covid import historic_cache
+from covid import projections
+from covid import rankings
+from covid import regions
+from covid import registry
+from covid import sir
+from covid import smoothing
+from covid import sources
+from covid import states
+from covid import update_data
+import synthetic_data
+
+BENCHMARKS = []
+
+PLOTTED_STATES = 8
+
+
+def benchmark(name, number=1, repeat=5):
+    """Register a benchmark. The decorated function receives the context dict, does any setup and
+    returns the callable to time."""
+    def register(function):
+        BENCHMARKS.append((name, function, number, repeat))
+        return function
+    return register
+
+
+def quiet(function):
+    def run():
+        with contextlib.redirect_stdout(io.StringIO()):
+            return function()
+    return run
+
+
+@benchmark("load.json")
+def load_json(context):
+    return lambda: [historic_cache.read_json(state) for state in context['states']]
+
+
+@benchmark("load.binary_cache")
+def load_binary_cache(context):
+    def load():
+        historic_cache._loaded = None
+        return [states.state_historic_data(state) for state in context['states']]
+    return load
+
+
+@benchmark("load.registry_hit", number=100)
+def load_registry_hit(context):
+    for state in context['states']:
+        registry.get_historic(state)
+    return lambda: [registry.get_historic(state) for state in context['states']]
+
+
+@benchmark("trends.calculate_trends.cold")
+def calculate_trends_cold(context):
+    module = calculate_trends
+
+    def run():
+        module._trend_cache = {}
+        return module.calculate_trends()
+    return quiet(run)
+
+
+@benchmark("trends.calculate_trends.warm", number=10)
+def calculate_trends_warm(context):
+    module = calculate_trends
+    quiet(module.calculate_trends)()
+    return quiet(module.calculate_trends)
+
+
+@benchmark("trends.rolling_doubling_time.per_window", repeat=3)
+def rolling_per_window(context):
+    histories = [registry.get_historic(state).get_all() for state in context['states']]
+
+    def run():
+        for data in histories:
+            [calculate_trends.doubling_time(data[i:i + 7]) for i in range(len(data) - 6)]
+    return run
+
+
+@benchmark("trends.rolling_doubling_time.vectorized", number=10)
+def rolling_vectorized(context):
+    histories = [registry.get_historic(state).get_all() for state in context['states']]
+    return lambda: calculate_trends.rolling_exponential_fit(calculate_trends.stack_series([data['positive'] for data in histories]), 7)
+
+
+def fit_benchmark(length, batch, kernel):
+    """Weighted log-linear fits of batch series of length days, one numpy.polyfit call per series or
+    one fit_log_linear call for all of them"""
+    def setup(context):
+        rng = numpy.random.default_rng(0)
+        y = numpy.cumsum(rng.integers(1, 1000, (batch, length)), axis=1).astype(numpy.float64)
+        x = numpy.arange(length)
+        if kernel == 'polyfit':
+            return lambda: [numpy.polyfit(x, numpy.log(row), 1, w=numpy.sqrt(row)) for row in y]
+        if batch == 1:
+            return lambda: calculate_trends.fit_log_linear(x, y[0])
+        return lambda: calculate_trends.fit_log_linear(x, y)
+    return setup
+
+
+for length in (7, 30, 120, 365):
+    for batch in (1, 56):
+        for kernel in ('polyfit', 'fit_log_linear'):
+            benchmark("fit.%s.%dx%d" % (kernel, batch, length), number=100 if batch == 1 else 10)(fit_benchmark(length, batch, kernel))
+
+
+@benchmark("sir.sir_integrate", number=10)
+def sir_integrate(context):
+    return lambda: sir.sir_integrate((4000000, 100, 10), 150, (0.3, 0.15))
+
+
+@benchmark("sir.sir_integrate_ensemble.1000", repeat=3)
+def sir_integrate_ensemble(context):
+    rng = numpy.random.default_rng(0)
+    inits = numpy.column_stack([rng.uniform(1e5, 5e6, 1000), rng.uniform(10, 1000, 1000), rng.uniform(0, 100, 1000)])
+    params = numpy.column_stack([rng.uniform(0.1, 0.5, 1000), rng.uniform(0.05, 0.2, 1000)])
+    return lambda: sir.sir_integrate_ensemble(inits, 150, params)
+
+
+@benchmark("sir.sir_gradient_descent", repeat=3)
+def sir_gradient_descent(context):
+    cases, init = sir.scenario_inputs(context['states'][0], 45, 0.98)
+    return lambda: sir.sir_gradient_descent(init, 45, (0.2, 0.15), cases, verbose=False)
+
+
+@benchmark("sir.fit_sir", repeat=3)
+def fit_sir(context):
+    cases, init = sir.scenario_inputs(context['states'][0], 45, 0.98)
+    return lambda: sir.fit_sir(cases, init)
+
+
+@benchmark("sir.monte_carlo_projection.2000", repeat=3)
+def monte_carlo_projection(context):
+    """Sampling and percentile bands only; the fit is given so it is not part of the time"""
+    data = registry.get_historic(context['states'][0]).get_latest_n(45)
+    inputs = (4000000, data['positive'], data['death'], data['recovered'])
+
+    def run():
+        for bands in sir.monte_carlo_projection('undertesting', *inputs, samples=2000, seed=0, fit=(0.25, 0.15, 1.0)):
+            pass
+        return bands
+    return run
+
+
+@benchmark("projections.get_projection", number=100)
+def get_projection(context):
+    """Serving a stored projection, which is all a /projections request does"""
+    state = context['states'][0]
+    projections.precompute_projections([state], samples=250)
+    return lambda: projections.get_projection(state)
+
+
+@benchmark("smoothing.three_day_average", number=10)
+def three_day_average(context):
+    series = [registry.get_historic(state).get_all()['positive'] for state in context['states']]
+    return lambda: [states.three_day_average(values) for values in series]
+
+
+@benchmark("smoothing.moving_average.matrix.7", number=10)
+def moving_average_matrix(context):
+    histories = [registry.get_historic(state).get_all() for state in context['states']]
+    matrix = calculate_trends.stack_series([data['positive'] for data in histories])
+    return lambda: smoothing.moving_average(smoothing.daily_difference(matrix), 7, center=False)
+
+
+@benchmark("smoothing.exponential_smoothing.matrix", number=10)
+def exponential_smoothing_matrix(context):
+    histories = [registry.get_historic(state).get_all() for state in context['states']]
+    matrix = calculate_trends.stack_series([data['positive'] for data in histories])
+    return lambda: smoothing.exponential_smoothing(matrix, span=7)
+
+
+@benchmark("states.get_after_n_cases", number=10)
+def get_after_n_cases(context):
+    histories = [registry.get_historic(state) for state in context['states']]
+    return lambda: [history.get_after_n_cases(n) for history in histories for n in (1, 10, 100, 1000)]
+
+
+@benchmark("states.crossing_dates", number=10)
+def crossing_dates(context):
+    histories = [registry.get_historic(state) for state in context['states']]
+    return lambda: states.crossing_dates(histories, [10 ** k for k in range(7)])
+
+
+@benchmark("regions.import_counties", repeat=1)
+def import_counties(context):
+    return lambda: regions.import_counties(context['county_csv'])
+
+
+@benchmark("regions.load_counties")
+def load_counties(context):
+    def load():
+        registry.registry.invalidate()
+        return [registry.get_historic(county) for county in context['counties']]
+    return load
+
+
+@benchmark("regions.rollup_counties_to_states", repeat=3)
+def rollup_counties(context):
+    info = registry.get_region_info()
+    children = [[registry.get_historic(county) for county in info.get_children(state)] for state in info.get_states()]
+    return lambda: [regions.rollup(histories) for histories in children if histories]
+
+
+@benchmark("rankings.counties", repeat=3)
+def rank_counties(context):
+    for county in context['counties']:
+        registry.get_historic(county)
+    return lambda: rankings.state_rankings(context['counties'])
+
+
+@benchmark("trends.rolling_doubling_time.counties", repeat=3)
+def rolling_counties(context):
+    matrix = calculate_trends.stack_series([registry.get_historic(county).get_all()['positive'] for county in context['counties']])
+    return lambda: calculate_trends.rolling_exponential_fit(matrix, 7)
+
+
+@benchmark("rankings.state_rankings", number=10)
+def state_rankings(context):
+    return lambda: rankings.state_rankings(context['states'])
+
+
+@benchmark("ingest.update_data.replay", repeat=3)
+def ingest_replay(context):
+    """A full ingest of every state from a replay of the benchmark data, with the ingest state
+    cleared so nothing is answered with a 304"""
+    source = sources.replay_source("data")
+
+    def run():
+        if os.path.exists(update_data.INGEST_STATE_FILE):
+            os.remove(update_data.INGEST_STATE_FILE)
+        return update_data.update_data(source=source)
+    return quiet(run)
+
+
+@benchmark("sir.cli", repeat=1)
+def sir_cli(context):
+    """The projection command line end to end, plots included, so a broken plotting call fails the run"""
+    env = dict(os.environ, MPLBACKEND="Agg", PYTHONPATH=ROOT)
+    commands = [[sys.executable, "-m", "covid.sir", "--state", context['states'][0]],
+                [sys.executable, "-m", "covid.sir", "--state", context['states'][0], "--monte-carlo", "500"]]
+
+    def run():
+        for command in commands:
+            subprocess.run(command, env=env, check=True, stdout=subprocess.DEVNULL)
+    return run
+
+
+@benchmark("startup.web_app", repeat=3)
+def web_app_startup(context):
+    """A fresh interpreter importing the web app against the benchmark data, as a gunicorn worker starts"""
+    code = ("import importlib.util, sys; "
+            "spec = importlib.util.spec_from_file_location('app', sys.argv[1]); "
+            "spec.loader.exec_module(importlib.util.module_from_spec(spec)); "
+            "heavy = [name for name in ('matplotlib', 'scipy', 'requests') if name in sys.modules]; "
+            "sys.exit('web app imported ' + ', '.join(heavy) if heavy else 0)")
+    env = dict(os.environ, COVID_REFRESH_IN_PROCESS="0", PYTHONPATH=os.path.join(ROOT, "flask"))
+    command = [sys.executable, "-c", code, os.path.join(ROOT, "flask", "covid-routing.py")]
+    return lambda: subprocess.run(command, env=env, check=True)
+
+
+def plot_benchmark(plot, **options):
+    def setup(context):
+        def run():
+            fig = Figure(figsize=(10, 7))
+            plot(context['states'][:PLOTTED_STATES], ax=fig.subplots(), **options)
+            fig.savefig(io.BytesIO(), format="png", dpi=100)
+        return run
+    return setup
+
+
+benchmark("plot.states_trend", repeat=3)(plot_benchmark(build_graphs.plot_states_trend, days=30))
+benchmark("plot.states_growth", repeat=3)(plot_benchmark(build_graphs.plot_states_growth, threshold=10))
+benchmark("plot.pos_test_rate", repeat=3)(plot_benchmark(build_graphs.plot_pos_test_rate, days=30))
+benchmark("plot.mortality_rate", repeat=3)(plot_benchmark(build_graphs.plot_mortality_rate, days=30))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=ROOT, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(state_count, days, missing_rate=0.05, name_filter=None, county_count=3000):
+    workdir = tempfile.mkdtemp(prefix="covid-bench-")
+    cwd = os.getcwd()
+    try:
+        os.makedirs(os.path.join(workdir, "data"))
+        shutil.copy(os.path.join(ROOT, "data", "states.json"), os.path.join(workdir, "data", "states.json"))
+        os.chdir(workdir)
+        state_list = synthetic_data.write_synthetic_data("data", count=state_count, days=days, missing_rate=missing_rate)
+        historic_cache.update_cache(state_list)
+        county_csv = synthetic_data.write_synthetic_counties("data", county_count, days, missing_rate)
+        counties = regions.import_counties(county_csv)
+        context = {'states': state_list, 'counties': counties, 'county_csv': county_csv}
+
+        # fits over windows with zeros warn on every call, which would drown the results
+        warnings.simplefilter("ignore")
+        results = {}
+        for name, setup, number, repeat in BENCHMARKS:
+            if name_filter and name_filter not in name:
+                continue
+            function = setup(context)
+            times = [t / number for t in timeit.repeat(function, number=number, repeat=repeat)]
+            results[name] = {'min': min(times), 'median': statistics.median(times), 'mean': statistics.mean(times),
+                             'number': number, 'repeat': repeat}
+            print("%-45s %12.6f s" % (name, results[name]['median']))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    meta = {'commit': git_commit(), 'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'python': platform.python_version(),
+            'numpy': numpy.__version__, 'states': state_count, 'counties': county_count, 'days': days,
+            'missing_rate': missing_rate}
+    return {'meta': meta, 'results': results}
+
+
+def compare(baseline, current, threshold=1.2):
+    """Print the median of every benchmark in both runs and flag ones slower than threshold times the baseline"""
+    print("%-45s %12s %12s %8s" % ("benchmark", "baseline", "current", "ratio"))
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['median']
+        ratio = result['median'] / before if before > 0 else float('inf')
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print("%-45s %12.6f %12.6f %8.2f%s" % (name, before, result['median'], ratio, flag))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suite on synthetic data")
+    parser.add_argument("--states", type=int, default=56)
+    parser.add_argument("--counties", type=int, default=3000)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--missing-rate", type=float, default=0.05)
+    parser.add_argument("--filter", default=None, help="only run benchmarks whose name contains this")
+    parser.add_argument("--output", default=None, help="results file (default benchmarks/results/<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    current = run_benchmarks(args.states, args.days, args.missing_rate, args.filter, args.counties)
+    output = args.output
+    if output is None:
+        output = os.path.join(ROOT, "benchmarks", "results", (current['meta']['commit'] or "local")[:12] + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as fp:
+        json.dump(current, fp, indent=2)
+    print("Saved " + output)
+
+    if args.compare:
+        with open(args.compare, "r") as fp:
+            compare(json.load(fp), current)
@@ -0,0 +1,22 @@
+"""Data loading, ingest, trends, charts and SIR modelling shared by the command line scripts and the
+web app in flask/.
+
+Importing the package loads nothing else; submodules are imported when first used, so the web data
+path never pays for matplotlib (build_graphs, render_charts) or scipy (sir). Scripts run as modules
+from the directory holding their data/ folder:
+
+    python -m covid.update_data
+    python -m covid.calculate_trends
+    python -m covid.render_charts --output-dir output"""
+
+import importlib
+
+SUBMODULES = ('build_graphs', 'calculate_trends', 'historic_cache', 'metrics', 'projections', 'rankings', 'regions',
+              'registry', 'render_charts', 'sir', 'smoothing', 'sources', 'states', 'update_data')
+
+
+def __getattr__(name):
+    # covid.states and friends without importing every submodule up front
+    if name in SUBMODULES:
+        return importlib.import_module("." + name, __name__)
+    raise AttributeError("module " + repr(__name__) + " has no attribute " + repr(name))
@@ -0,0 +1,169 @@
+import numpy
+from . import calculate_trends
+import matplotlib.pyplot as plt
+from .states import parse_date
+from .registry import get_region_info, get_historic
+
+
+def chart_axes(ax=None):
+    """Axes to draw a chart on. Without ax the chart goes on pyplot's current figure as before;
+    with ax the caller owns the figure and the plot function only draws."""
+    if ax is None:
+        fig = plt.gcf()
+        return fig, plt.gca(), False
+    return ax.figure, ax, True
+
+
+def finish_chart(fig, filename, draw_only):
+    """Size the figure and show or save it, unless the caller passed its own axes"""
+    fig.set_size_inches(10, 7)
+    if draw_only:
+        return
+    if filename is None:
+        plt.show()
+    else:
+        fig.savefig("output/" + filename, dpi=100)
+
+
+def plot_states_trend(states, data_name='positive', trendline=True, logarithmic=True, pop_adjusted=False, days=0, filename=None, ax=None):
+    fig, ax, draw_only = chart_axes(ax)
+    index = 0
+    si = get_region_info()
+    for state in states:
+        data_handle = get_historic(state)
+        if days > 0:
+            data_points = data_handle.get_latest_n(days)
+        else:
+            data_points = data_handle.get_after_n_cases(1)
+
+        dates = list(map(parse_date, data_points.dates))
+        cases = data_points[data_name]
+
+        if pop_adjusted:
+            population = si.get_population(state)
+            cases = cases / population * 10000
+
+        (r,a) = calculate_trends.weighted_exponential_fit(numpy.arange(len(cases)), cases)
+        if trendline:
+            fit_y = numpy.exp(a) * numpy.exp(r * numpy.arange(len(cases)))
+            ax.plot(dates, fit_y, "C"+str(index)+"--")
+            ax.plot(dates, cases, "C"+str(index)+"o", label=si.get_name(state) + " (rate=%0.4f)"%r)
+        else:
+            ax.plot(dates, cases, "C"+str(index)+".-", label=si.get_name(state) + " (rate=%0.4f)"%r)
+        index += 1
+
+    if logarithmic:
+        ax.set_yscale("log")
+    ax.legend()
+    title = "Trend in "  + data_name.capitalize() + " Count by State, "
+    if days == 0:
+        title += "All Days"
+    else:
+        title += "Last " + str(days) + " Days"
+    if pop_adjusted:
+        title += " (population adjusted)"
+    ax.set_title(title)
+    ylabel = data_name + " count"
+    if pop_adjusted:
+        ylabel += " per 10,000 people"
+    ax.set_ylabel(ylabel)
+    ax.grid(True)
+    finish_chart(fig, filename, draw_only)
+
+
+def plot_states_growth(states, data_name="positive", logarithmic=True, threshold=100, filename=None, ax=None):
+    fig, ax, draw_only = chart_axes(ax)
+    index = 0
+    si = get_region_info()
+    max_days = 0
+    max_data = 0
+    for state in states:
+        data_handle = get_historic(state)
+        data_points = data_handle.get_after_n_cases(threshold)
+
+        dates = range(len(data_points))
+        data = data_points[data_name]
+
+        if max_days < len(data_points):
+            max_days = len(data_points)
+        if max_data < max(data):
+            max_data = max(data)
+
+        ax.plot(dates, data, "C"+str(index)+".-", label=si.get_name(state))
+        index += 1
+
+    for double_time in [1,2,3,5,10]:
+        d = max_days
+        c = threshold * (2**(max_days/double_time))
+        if c > max_data:
+            c = max_data
+            d = (numpy.log(c/threshold)/numpy.log(2)) * double_time
+        ax.plot([0,d], [threshold,c], color='#bbbbbb', linestyle="--")
+
+    if logarithmic:
+        ax.set_yscale("log")
+    ax.legend()
+    ax.set_title("Growth Rate Since 100th Case\n(dotted lines represent doubling every 1, 2, 3, 5, and 10 days)")
+    ax.set_ylabel("Cases")
+    ax.set_xlabel("Days Since 100th Case")
+    ax.grid(True)
+    finish_chart(fig, filename, draw_only)
+
+
+def plot_pos_test_rate(states, threshold=10, filename=None, days=0, ax=None):
+    fig, ax, draw_only = chart_axes(ax)
+    index = 0
+    si = get_region_info()
+    for state in states:
+        data_handle = get_historic(state)
+        if days == 0:
+            data_points = data_handle.get_all()
+        else:
+            data_points = data_handle.get_latest_n(days)
+
+        dates = list(map(parse_date, data_points.dates))
+        positive = data_points['positive']
+        total = data_points.filled('total', 1)
+        pos_test_rate = positive/total * 100
+        ax.plot(dates, pos_test_rate, "C"+str(index)+".-", label=si.get_name(state))
+        index += 1
+    ax.legend()
+    ax.set_title("Positive Test Rate Trend by State")
+    ax.set_ylabel("% of tests reported positive")
+    ax.axhline(y=threshold,color='r',linestyle='--')
+    ax.grid(True, which="both")
+    finish_chart(fig, filename, draw_only)
+
+
+def plot_mortality_rate(states, threshold=2.5, filename=None, days=0, ax=None):
+    fig, ax, draw_only = chart_axes(ax)
+    index = 0
+    si = get_region_info()
+    for state in states:
+        data_handle = get_historic(state)
+        if days == 0:
+            data_points = data_handle.get_all()
+        else:
+            data_points = data_handle.get_latest_n(days)
+
+        dates = list(map(parse_date, data_points.dates))
+        death = data_points['death']
+        positive = data_points.filled('positive', 1)
+        mortality_rate = death/positive * 100
+        ax.plot(dates, mortality_rate, "C"+str(index)+".-", label=si.get_name(state))
+        index += 1
+    ax.legend()
+    ax.set_title("Mortality Rate Trend by State")
+    ax.set_ylabel("% of positive cases resulting in death")
+    ax.axhline(y=threshold,color='r',linestyle='--')
+    ax.grid(True, which="both")
+    finish_chart(fig, filename, draw_only)
+
+
+if __name__ == "__main__":
+    states = ['KY',"TN","NY","IN","GA","OH","FL","AL"]
+    plot_states_trend(states, data_name="positive", trendline=False, logarithmic=True, pop_adjusted=True, days=0)
+    plot_states_trend(states, data_name="positive", trendline=True, logarithmic=True, pop_adjusted=False, days=10)
+    plot_states_growth(states, data_name="positive", logarithmic=True, threshold=100)
+    plot_pos_test_rate(states, days=30)
+    plot_mortality_rate(states, days=30)
@@ -0,0 +1,323 @@
+#!/usr/bin/python3
+import hashlib
+import json
+import os
+import threading
+
+import numpy
+
+from . import metrics
+from .registry import get_state_info, get_historic
+
+TREND_CACHE_FILE = "data/trends_cache.json"
+# bumped whenever state_trends changes, so cached entries computed the old way are recomputed
+TRENDS_FORMAT = 2
+
+# per-state results of calculate_trends, loaded from TREND_CACHE_FILE on first use
+_trend_cache = None
+_trend_cache_lock = threading.Lock()
+
+def growth_inputs(data, data_name='positive'):
+    """(x, y) that growth_rate fits: the positive values of a field, numbered without gaps"""
+    values = data[data_name]
+    y = values[values > 0]
+    return numpy.arange(len(y)), y
+
+def growth_rate(data, data_name='positive'):
+    return weighted_exponential_fit(*growth_inputs(data, data_name))
+
+def case_growth_rate(data):
+    return growth_rate(data, 'positive')
+
+def death_growth_rate(data):
+    return growth_rate(data, 'death')
+
+class log_linear_fit:
+    """Weighted least squares fit of log(y) = intercept + rate*x for one series or many at once.
+    Every attribute has the shape of the inputs without their last (day) axis."""
+    def __init__(self, rate, intercept, rate_se, intercept_se, r2, points):
+        self.rate = rate
+        self.intercept = intercept
+        self.rate_se = rate_se
+        self.intercept_se = intercept_se
+        self.r2 = r2
+        self.points = points
+
+    def doubling_time(self):
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.log(2) / self.rate
+
+    def doubling_time_se(self):
+        """Standard error of the doubling time, propagated from rate_se"""
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            return numpy.log(2) * self.rate_se / (self.rate * self.rate)
+
+def fit_log_linear(x, y, weights=None, quality=True):
+    """Fit log(y) = intercept + rate*x along the last axis from closed-form weighted sums.
+
+    y may be one series or a stack of them (x is shared or has the same shape). weights default to y,
+    which is what numpy.polyfit(x, log(y), 1, w=sqrt(y)) minimises, so the rate and intercept match it.
+    Values that are NaN or not positive are left out of their series. Standard errors use the weighted
+    residuals over points - 2 degrees of freedom like polyfit(cov=True); R^2 is the weighted coefficient of
+    determination. Series with fewer than two points, or no spread in x, give NaN. Without quality a
+    stack of series skips the passes that only the standard errors and R^2 need, and leaves them None."""
+    y = numpy.asarray(y, dtype=numpy.float64)
+    if y.ndim == 1:
+        return fit_log_linear_series(numpy.asarray(x, dtype=numpy.float64), y, weights)
+    x = numpy.asarray(x, dtype=numpy.float64)
+    # shifting x leaves the rate unchanged and keeps sxx from cancelling; the intercept is shifted back below
+    shift = x.mean() if x.size else 0.0
+    x = x - shift
+    valid = y > 0
+    log_y = numpy.log(y, out=numpy.zeros(y.shape), where=valid)
+    w = numpy.where(valid, y if weights is None else numpy.broadcast_to(weights, y.shape), 0.0)
+    # sums over the last axis as matrix products, much faster than sum(axis=-1) on short series
+    ones = numpy.ones(y.shape[-1])
+    if x.ndim == 1:
+        def dot_x(a):
+            return a @ x
+        swxx = w @ (x * x)
+    else:
+        x = numpy.broadcast_to(x, y.shape)
+        def dot_x(a):
+            return (a * x) @ ones
+        swxx = (w * x * x) @ ones
+
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        s0 = w @ ones
+        mean_x = dot_x(w) / s0
+        w_log_y = w * log_y
+        mean_y = w_log_y @ ones / s0
+        sxx = swxx - s0 * mean_x * mean_x
+        if quality:
+            # log(y) is centred on its weighted mean before squaring so nearly flat series keep their precision
+            dy = log_y - mean_y[..., None]
+            wdy = w * dy
+            sxy = dot_x(wdy)
+            syy = (wdy * dy) @ ones
+        else:
+            sxy = dot_x(w_log_y) - s0 * mean_x * mean_y
+        rate = sxy / sxx
+        intercept = mean_y - rate * (mean_x + shift)
+        usable = sxx > 0
+        if not quality:
+            return log_linear_fit(numpy.where(usable, rate, numpy.nan), numpy.where(usable, intercept, numpy.nan),
+                                  None, None, None, None)
+        points = valid @ ones
+        residual = numpy.maximum(syy - rate * sxy, 0.0)
+        variance = numpy.where(points > 2, residual / (points - 2), numpy.nan)
+        rate_se = numpy.sqrt(variance / sxx)
+        intercept_se = numpy.sqrt(variance * (1.0 / s0 + (mean_x + shift) ** 2 / sxx))
+        r2 = numpy.where(syy > 0, 1.0 - residual / syy, 1.0)
+    return log_linear_fit(*(numpy.where(usable, value, numpy.nan) for value in (rate, intercept, rate_se, intercept_se, r2)),
+                          points.astype(numpy.int64))
+
+def fit_log_linear_series(x, y, weights=None):
+    """fit_log_linear of a single series with scalar arithmetic, which is several times faster than the
+    batched path for the few points /trends fits"""
+    valid = y > 0
+    w = y if weights is None else numpy.broadcast_to(numpy.asarray(weights, dtype=numpy.float64), y.shape)
+    if not valid.all():
+        x, y, w = x[valid], y[valid], w[valid]
+    points = len(y)
+    nan = float('nan')
+    if points < 2:
+        return log_linear_fit(nan, nan, nan, nan, nan, points)
+    log_y = numpy.log(y)
+    s0 = float(w.sum())
+    mean_x = float(w @ x) / s0
+    mean_y = float(w @ log_y) / s0
+    dx = x - mean_x
+    dy = log_y - mean_y
+    wdx = w * dx
+    sxx = float(wdx @ dx)
+    if not sxx > 0:
+        return log_linear_fit(nan, nan, nan, nan, nan, points)
+    sxy = float(wdx @ dy)
+    syy = float((w * dy) @ dy)
+    rate = sxy / sxx
+    residual = max(syy - rate * sxy, 0.0)
+    variance = residual / (points - 2) if points > 2 else nan
+    return log_linear_fit(rate, mean_y - rate * mean_x, (variance / sxx) ** 0.5,
+                          (variance * (1.0 / s0 + mean_x * mean_x / sxx)) ** 0.5,
+                          1.0 - residual / syy if syy > 0 else 1.0, points)
+
+def exponential_fit(x, y):
+    fit = fit_log_linear(x, y, numpy.ones(numpy.shape(y)))
+    return numpy.array([fit.rate, fit.intercept])
+
+def weighted_exponential_fit(x, y, quality=False):
+    """[rate, intercept] of y = exp(intercept + rate*x) weighted like numpy.polyfit with w=sqrt(y),
+    or the whole log_linear_fit with quality"""
+    fit = fit_log_linear(x, y)
+    return fit if quality else numpy.array([fit.rate, fit.intercept])
+
+def to_exponential_function(fit):
+    return "y=" + str(numpy.exp(fit[1])) +  "*exp(" + str(fit[0]) + "*t)"
+
+def fit_doubling_time(fit):
+    return numpy.log(2)/fit[0]
+
+def doubling_time(data, data_name='positive'):
+    return fit_doubling_time(growth_rate(data, data_name))
+
+def stack_series(series, align='left'):
+    """Stack 1-D series of different lengths into a series x days matrix, padding with NaN.
+    align='left' lines up the first days of every series, align='right' the last days."""
+    days = max([len(y) for y in series] + [0])
+    matrix = numpy.full((len(series), days), numpy.nan)
+    for i, y in enumerate(series):
+        if align == 'left':
+            matrix[i, :len(y)] = y
+        else:
+            matrix[i, days - len(y):] = y
+    return matrix
+
+def rolling_exponential_fit(matrix, window=7):
+    """Fit y = exp(intercept + rate*t) to every trailing window of every row of a series x days matrix at once.
+
+    This is the same weighted least squares as weighted_exponential_fit, done by fit_log_linear on all
+    windows together, with t counted from the start of each window.
+    Returns (rate, intercept, doubling_time) matrices shaped like the input, where column j holds the
+    fit of days j-window+1..j. The first window-1 columns, and any window containing a value that is
+    not positive (or NaN), are NaN. Unlike growth_rate, non-positive values are not dropped from a window."""
+    matrix = numpy.atleast_2d(numpy.asarray(matrix, dtype=numpy.float64))
+    rate = numpy.full(matrix.shape, numpy.nan)
+    intercept = numpy.full(matrix.shape, numpy.nan)
+    if matrix.shape[1] >= window:
+        y = numpy.lib.stride_tricks.sliding_window_view(matrix, window, axis=1)
+        # a window is valid when the running count of bad days does not grow across it
+        bad = numpy.cumsum(~(matrix > 0), axis=1)
+        valid = bad[:, window - 1:] == numpy.pad(bad, ((0, 0), (1, 0)))[:, :-window]
+        fit = fit_log_linear(numpy.arange(window), y, quality=False)
+        rate[:, window - 1:] = numpy.where(valid, fit.rate, numpy.nan)
+        intercept[:, window - 1:] = numpy.where(valid, fit.intercept, numpy.nan)
+    with numpy.errstate(divide='ignore'):
+        doubling = numpy.log(2) / rate
+    return rate, intercept, doubling
+
+def data_version(data, columns=('positive', 'death')):
+    """Identify the data something is computed from: the last date plus a hash of the columns it reads,
+    by default the ones a state's trends use"""
+    if len(data) == 0:
+        return "empty"
+    digest = hashlib.sha1(numpy.ascontiguousarray(data.dates).tobytes())
+    for name in columns:
+        digest.update(numpy.ascontiguousarray(data.column(name)).tobytes())
+        digest.update(numpy.ascontiguousarray(data.mask(name)).tobytes())
+    return str(data.dates[-1]) + "-" + digest.hexdigest()[:16]
+
+def fit_quality(fit):
+    """R^2, standard errors and point count of a log_linear_fit, with None where the fit is undefined"""
+    values = {'r2': fit.r2, 'rate_se': fit.rate_se, 'doubling_time_se': fit.doubling_time_se()}
+    quality = {name: float(value) if numpy.isfinite(value) else None for name, value in values.items()}
+    quality['points'] = int(fit.points)
+    return quality
+
+def state_trends(data):
+    """(doubling times, fit quality) for one state, each keyed like the output of calculate_trends"""
+    latest_data = data.get_latest_n(7)
+    fits = {'case7': weighted_exponential_fit(*growth_inputs(latest_data, 'positive'), quality=True),
+            'death': weighted_exponential_fit(*growth_inputs(latest_data, 'death'), quality=True),
+            'case10': weighted_exponential_fit(*growth_inputs(data.get_after_n_cases(10), 'positive'), quality=True)}
+    return ({name: str(fit.doubling_time()) for name, fit in fits.items()},
+            {name: fit_quality(fit) for name, fit in fits.items()})
+
+def load_trend_cache():
+    try:
+        with open(TREND_CACHE_FILE, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+def save_trend_cache(cache):
+    with open(TREND_CACHE_FILE + ".tmp", "w") as fp:
+        json.dump(cache, fp)
+    os.replace(TREND_CACHE_FILE + ".tmp", TREND_CACHE_FILE)
+
+@metrics.timed_function('calculate_trends')
+def calculate_trends(regions=None):
+    """Doubling times for every state, or for the given region IDs, plus the R^2 and standard errors of
+    each fit under 'fit_quality'. Results are cached per region on disk
+    together with the data_version they were computed from, so only regions whose data changed are recomputed.
+    Regions without any history are left out."""
+    global _trend_cache
+    output = {'case7': {},'death': {},'case10' :{}, 'fit_quality': {'case7': {}, 'death': {}, 'case10': {}}}
+    if regions is None:
+        regions = get_state_info().get_states()
+    with _trend_cache_lock:
+        if _trend_cache is None:
+            _trend_cache = load_trend_cache()
+        changed = False
+        for state in regions:
+            try:
+                data = get_historic(state)
+            except OSError:
+                # never fetched successfully; the other states' trends are still worth serving
+                continue
+            version = data_version(data)
+            entry = _trend_cache.get(state)
+            if entry is None or entry['version'] != version or entry.get('format') != TRENDS_FORMAT:
+                with metrics.timed('trends.state', state):
+                    trends, quality = state_trends(data)
+                entry = {'version': version, 'format': TRENDS_FORMAT, 'trends': trends, 'fit_quality': quality}
+                _trend_cache[state] = entry
+                changed = True
+            for name, value in entry['trends'].items():
+                output[name][str(state)] = value
+                output['fit_quality'][name][str(state)] = entry['fit_quality'][name]
+        if changed:
+            save_trend_cache(_trend_cache)
+
+    for name, title in (('case7', "Average case doubling time in days for past 7 days of data"),
+                        ('death', "Average death doubling time in days for past 7 days of data"),
+                        ('case10', "Average case doubling time in days since 10th confirmed case")):
+        print(title)
+        for state, value in output[name].items():
+            print(state + "," + value)
+
+    return output
+
+def plot_doubling_times():
+    """Show the latest 7 day doubling time of every state and the rolling doubling time of a few"""
+    # matplotlib is only needed here, keep it out of the import of this module
+    from matplotlib import pyplot
+
+    si = get_state_info()
+    states = si.get_states()
+
+    # calculate doubling time for last seven days for all tracked states
+    doubling_time_last_seven = []
+    for state in states:
+        data = get_historic(state).get_latest_n(7)
+        doubling_time_last_seven.append(doubling_time(data))
+    pyplot.bar(range(len(states)), doubling_time_last_seven, tick_label=list(states))
+    pyplot.title("Average doubling time over past 7 days")
+    pyplot.ylabel("Average doubling time (days)")
+    fig = pyplot.gcf()
+    fig.set_size_inches(10, 7)
+    pyplot.show()
+    pyplot.close()
+
+    # calculate doubling time for each seven day window for all tracked states
+    plotted_states = ['KY',"TN","NY","IN","LA","OH", "MI"]
+    positives = stack_series([get_historic(state).get_all()['positive'] for state in plotted_states])
+    rate, intercept, doubling = rolling_exponential_fit(positives, 7)
+    for i, state in enumerate(plotted_states):
+        # column j is the window ending on day j, plotted at the window's middle day
+        days = numpy.flatnonzero(~numpy.isnan(positives[i]))
+        if len(days) > 7:
+            pyplot.plot(range(3,len(days)-3), doubling[i, 6:len(days)], label=state)
+    pyplot.title("Average doubling time (7 day moving average, higher is better)")
+    pyplot.ylabel("Average case doubling time (days)")
+    pyplot.xlabel("Days since first reported case")
+    pyplot.legend()
+    pyplot.grid(True)
+    fig = pyplot.gcf()
+    fig.set_size_inches(10, 7)
+    pyplot.show()
+    pyplot.close()
+
+if __name__ == "__main__":
+    plot_doubling_times()
+    calculate_trends()
@@ -0,0 +1,195 @@
+#!/usr/bin/python3
+"""Binary columnar copy of every state's history that can be memory-mapped.
+
+All states are stored together in three .npy files (values, masks, dates) with one row per field
+and one column per day, plus data/historic_index.json describing where each state's days are.
+regions.py keeps the other levels of the region hierarchy in files of the same layout.
+Each rewrite uses new file names and the index is replaced last, so a reader always sees a complete
+generation, and processes that map the same generation share its pages."""
+
+import glob
+import json
+import os
+import time
+
+import numpy
+
+DATA_DIR = "data"
+INDEX_FILE = os.path.join(DATA_DIR, "historic_index.json")
+
+_loaded = None
+
+
+class column_store:
+    """One generation of a consolidated columnar file, memory-mapped read-only. index['series'] maps
+    each series id to its span of days ('rows') and the fields it reported ('columns')."""
+    def __init__(self, index, index_mtime):
+        self.index = index
+        self.index_mtime = index_mtime
+        self.series = index['series']
+        self.columns = {name: i for i, name in enumerate(index['columns'])}
+        self.values = numpy.load(os.path.join(DATA_DIR, index['values']), mmap_mode='r')
+        self.masks = numpy.load(os.path.join(DATA_DIR, index['masks']), mmap_mode='r')
+        self.dates = numpy.load(os.path.join(DATA_DIR, index['dates']), mmap_mode='r')
+
+    def get(self, series_id):
+        """(dates, columns, masks) for a series, as views into the mapped files"""
+        entry = self.series[series_id]
+        start, stop = entry['rows']
+        columns = {}
+        masks = {}
+        for name in entry['columns']:
+            i = self.columns[name]
+            columns[name] = self.values[i, start:stop]
+            masks[name] = self.masks[i, start:stop]
+        return self.dates[start:stop], columns, masks
+
+
+class historic_cache(column_store):
+    """The generation of the state cache, each state tagged with the mtime of its JSON file"""
+    def is_current(self, state):
+        """True if the cache holds the state and its JSON file has not changed since the cache was written"""
+        entry = self.series.get(state)
+        if entry is None:
+            return False
+        try:
+            return os.stat(json_path(state)).st_mtime_ns <= entry['source_mtime']
+        except OSError:
+            return True
+
+
+def json_path(state):
+    return os.path.join(DATA_DIR, state + "_historic.json")
+
+
+def build_columns(records):
+    """Convert a list of JSON records into (dates, columns, masks). Every field that only ever holds
+    numbers or null becomes a float64 column; text fields are dropped."""
+    dates = numpy.array([x['date'] for x in records], dtype=numpy.int64)
+    names = set()
+    for record in records:
+        names.update(record.keys())
+    names.discard('date')
+
+    columns = {}
+    masks = {}
+    for name in names:
+        values = [x.get(name) for x in records]
+        if not all(v is None or (isinstance(v, (int, float)) and not isinstance(v, bool)) for v in values):
+            continue
+        masks[name] = numpy.array([v is not None for v in values], dtype=bool)
+        columns[name] = numpy.array([0 if v is None else v for v in values], dtype=numpy.float64)
+    return dates, columns, masks
+
+
+def read_json(state):
+    """(dates, columns, masks) parsed from the state's JSON file"""
+    with open(json_path(state), 'r') as fp:
+        return build_columns(json.load(fp))
+
+
+def load_store(index_file, loaded, store_class=column_store):
+    """The current generation behind index_file, or None if none has been written. loaded is the
+    generation returned by the previous call, which is reused unless the index has been replaced."""
+    try:
+        index_mtime = os.stat(index_file).st_mtime_ns
+    except OSError:
+        return None
+    if loaded is None or loaded.index_mtime != index_mtime:
+        try:
+            with open(index_file, 'r') as fp:
+                index = json.load(fp)
+            return store_class(index, index_mtime)
+        except (OSError, ValueError, KeyError):
+            # the files of this generation were removed by a newer writer, or the index is from an
+            # older layout; use the next index
+            return None
+    return loaded
+
+
+def load_cache():
+    """The current state cache generation, or None if no cache has been written.
+    Reopens the files only when the index has been replaced since the last call."""
+    global _loaded
+    _loaded = load_store(INDEX_FILE, _loaded, historic_cache)
+    return _loaded
+
+
+def lookup(state):
+    """(dates, columns, masks) for a state from the cache, or None if the JSON file is newer or the state is missing"""
+    cache = load_cache()
+    if cache is None or not cache.is_current(state):
+        return None
+    return cache.get(state)
+
+
+def write_cache(states):
+    """Write a new cache generation holding the given states. States whose cached copy is still current
+    are copied from the previous generation; the others are parsed from JSON. Returns the states parsed."""
+    previous = load_cache()
+    parsed = []
+    histories = {}
+    source_mtimes = {}
+    for state in states:
+        try:
+            source_mtimes[state] = os.stat(json_path(state)).st_mtime_ns
+        except OSError:
+            continue
+        if previous is not None and previous.is_current(state):
+            histories[state] = previous.get(state)
+        else:
+            histories[state] = read_json(state)
+            parsed.append(state)
+
+    write_store("historic", INDEX_FILE, histories, {state: {'source_mtime': source_mtimes[state]} for state in histories})
+    return parsed
+
+
+def write_store(prefix, index_file, histories, extra=None):
+    """Write {series id: (dates, columns, masks)} as a new generation of <prefix>.<generation>.*.npy files
+    and replace index_file, then delete older generations. extra adds fields to a series' index entry."""
+    names = sorted(set(name for _, columns, _ in histories.values() for name in columns))
+    rows = {name: i for i, name in enumerate(names)}
+    total = sum(len(dates) for dates, _, _ in histories.values())
+    values = numpy.zeros((len(names), total), dtype=numpy.float64)
+    masks = numpy.zeros((len(names), total), dtype=bool)
+    all_dates = numpy.zeros(total, dtype=numpy.int64)
+
+    index = {'columns': names, 'series': {}}
+    start = 0
+    for series_id, (dates, columns, series_masks) in histories.items():
+        stop = start + len(dates)
+        all_dates[start:stop] = dates
+        for name in columns:
+            values[rows[name], start:stop] = columns[name]
+            masks[rows[name], start:stop] = series_masks[name]
+        index['series'][series_id] = dict((extra or {}).get(series_id, {}), rows=[start, stop], columns=sorted(columns))
+        start = stop
+
+    generation = str(time.time_ns())
+    for part, array in (('values', values), ('masks', masks), ('dates', all_dates)):
+        index[part] = prefix + "." + generation + "." + part + ".npy"
+        numpy.save(os.path.join(DATA_DIR, index[part]), array)
+    with open(index_file + ".tmp", "w") as fp:
+        json.dump(index, fp)
+    os.replace(index_file + ".tmp", index_file)
+
+    # processes that still map an older generation keep their pages until they reopen the index
+    for path in glob.glob(os.path.join(DATA_DIR, prefix + ".*.npy")):
+        if os.path.basename(path).split(".")[1] != generation:
+            os.remove(path)
+
+
+def update_cache(states):
+    """Rewrite the cache if any state is missing from it or its JSON file has changed. Returns the states parsed."""
+    states = [state for state in states if os.path.exists(json_path(state))]
+    cache = load_cache()
+    if cache is not None and set(states) == set(cache.series) and all(map(cache.is_current, states)):
+        return []
+    return write_cache(states)
+
+
+if __name__ == "__main__":
+    from .states import state_info
+    parsed = update_cache(list(state_info().get_states()))
+    print("Parsed " + str(len(parsed)) + " states into " + INDEX_FILE)
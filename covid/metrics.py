@@ -0,0 +1,323 @@
+"""Lightweight timing histograms, counters and an optional sampling profiler.
+
+    with metrics.timed('load', state):
+        ...
+
+    @metrics.timed_function('calculate_trends')
+    def calculate_trends(): ...
+
+render() produces the Prometheus text exposition format. Everything is kept in this process. When
+COVID_METRICS_DIR is set (gunicorn.conf.py sets it) each process also saves a snapshot there with
+maybe_write_snapshot(), and render(directory=...) sums the snapshots of every worker, so a scrape
+does not depend on which worker answers it. The refresh process writes its own metrics to a file
+(see flask/refresh.py) under a different namespace."""
+
+import collections
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+NAMESPACE = os.environ.get("COVID_METRICS_NAMESPACE", "covid")
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+MULTIPROCESS_DIR = os.environ.get("COVID_METRICS_DIR")
+SNAPSHOT_INTERVAL = float(os.environ.get("COVID_METRICS_SNAPSHOT_SECONDS", 5))
+STATES_FILE = "data/states.json"
+
+_lock = threading.Lock()
+_snapshot_lock = threading.Lock()
+_last_snapshot = 0.0
+_histograms = {}
+_counters = {}
+_gauges = {}
+_known_states = None
+
+
+class histogram:
+    """Observations bucketed per label set"""
+    def __init__(self, name, help, label_names, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, value, labels):
+        with _lock:
+            entry = self.series.get(labels)
+            if entry is None:
+                entry = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self, namespace):
+        name = namespace + "_" + self.name
+        lines = ["# HELP " + name + " " + self.help, "# TYPE " + name + " histogram"]
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = format_labels(self.label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                lines.append(name + "_bucket" + format_labels(self.label_names + ('le',), labels + (repr(bound),)) + " " + str(bucket_count))
+            lines.append(name + "_bucket" + format_labels(self.label_names + ('le',), labels + ("+Inf",)) + " " + str(count))
+            lines.append(name + "_sum" + base + " " + repr(total))
+            lines.append(name + "_count" + base + " " + str(count))
+        return lines
+
+
+class counter:
+    def __init__(self, name, help, label_names):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.series = collections.Counter()
+
+    def inc(self, labels, amount=1):
+        with _lock:
+            self.series[labels] += amount
+
+    def render(self, namespace):
+        name = namespace + "_" + self.name
+        lines = ["# HELP " + name + " " + self.help, "# TYPE " + name + " counter"]
+        for labels, value in sorted(self.series.items()):
+            lines.append(name + format_labels(self.label_names, labels) + " " + str(value))
+        return lines
+
+
+def format_labels(names, values):
+    if not names:
+        return ""
+    escaped = [str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values]
+    return "{" + ",".join(name + '="' + value + '"' for name, value in zip(names, escaped)) + "}"
+
+
+def get_histogram(name, help, label_names):
+    with _lock:
+        if name not in _histograms:
+            _histograms[name] = histogram(name, help, tuple(label_names))
+        return _histograms[name]
+
+
+def get_counter(name, help, label_names):
+    with _lock:
+        if name not in _counters:
+            _counters[name] = counter(name, help, tuple(label_names))
+        return _counters[name]
+
+
+def register_gauge(name, help, read):
+    """Report read() as a gauge every time metrics are rendered"""
+    with _lock:
+        _gauges[name] = (help, read)
+
+
+def state_label(state):
+    """The state label of a stage: the state itself if states.json lists it, otherwise its region level
+    ("nation" or "county") or "other", so counties and unknown IDs cannot grow the number of series"""
+    global _known_states
+    if not state:
+        return ""
+    if _known_states is None:
+        try:
+            with open(STATES_FILE, 'r') as fp:
+                _known_states = frozenset(json.load(fp))
+        except (OSError, ValueError):
+            _known_states = frozenset()
+    if state in _known_states:
+        return state
+    from .regions import region_level
+    level = region_level(state)
+    return level if level != 'state' else "other"
+
+
+def observe_stage(stage, seconds, state=""):
+    get_histogram("stage_seconds", "Time spent per pipeline stage and state", ('stage', 'state')).observe(seconds, (stage, state_label(state)))
+
+
+@contextmanager
+def timed(stage, state=""):
+    """Time the enclosed block as one observation of stage (and state, when given)"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start, state)
+
+
+def timed_function(stage):
+    """Decorator form of timed()"""
+    def decorate(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with timed(stage):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """The metrics of this process as JSON-ready data, gauges read now"""
+    with _lock:
+        histograms = {name: {'help': family.help, 'labels': list(family.label_names), 'buckets': list(family.buckets),
+                             'series': [[list(labels), list(counts), total, count]
+                                        for labels, (counts, total, count) in family.series.items()]}
+                      for name, family in _histograms.items()}
+        counters = {name: {'help': family.help, 'labels': list(family.label_names),
+                           'series': [[list(labels), value] for labels, value in family.series.items()]}
+                    for name, family in _counters.items()}
+        gauges = list(_gauges.items())
+    return {'pid': os.getpid(), 'histograms': histograms, 'counters': counters,
+            'gauges': {name: [help, float(read())] for name, (help, read) in gauges}}
+
+
+def write_snapshot(directory=MULTIPROCESS_DIR):
+    """Save snapshot() as <pid>.json in the directory the workers share"""
+    path = os.path.join(directory, str(os.getpid()) + ".json")
+    with open(path + ".tmp", "w") as fp:
+        json.dump(snapshot(), fp)
+    os.replace(path + ".tmp", path)
+
+
+def maybe_write_snapshot(directory=MULTIPROCESS_DIR, interval=SNAPSHOT_INTERVAL):
+    """write_snapshot() if the last one is older than interval seconds and no other thread is writing.
+    Does nothing unless a shared directory is configured."""
+    global _last_snapshot
+    if directory is None or time.monotonic() - _last_snapshot < interval:
+        return
+    if not _snapshot_lock.acquire(blocking=False):
+        return
+    try:
+        _last_snapshot = time.monotonic()
+        write_snapshot(directory)
+    except OSError as e:
+        print("ERROR: could not save metrics snapshot: " + str(e))
+    finally:
+        _snapshot_lock.release()
+
+
+def reset():
+    """Drop every observation, keeping the metrics registered. A forked worker calls this so what it
+    inherited from the master is not counted again in each worker's snapshot."""
+    with _lock:
+        for family in list(_histograms.values()) + list(_counters.values()):
+            family.series.clear()
+
+
+def clear_snapshots(directory=MULTIPROCESS_DIR):
+    """Remove the snapshots of an earlier server, for the master to call before forking workers"""
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".json") or name.endswith(".tmp"):
+            os.remove(os.path.join(directory, name))
+
+
+def read_snapshots(directory):
+    """Every snapshot in the directory except this process's own"""
+    snapshots = []
+    for name in os.listdir(directory):
+        if not name.endswith(".json") or name == str(os.getpid()) + ".json":
+            continue
+        try:
+            with open(os.path.join(directory, name), 'r') as fp:
+                snapshots.append(json.load(fp))
+        except (OSError, ValueError):
+            pass
+    return snapshots
+
+
+def is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError:
+        return False
+    return True
+
+
+def merge_snapshots(snapshots):
+    """(families, gauges) summed over snapshots. Histograms and counters of exited workers are kept so
+    totals never decrease; gauges only count processes still running."""
+    histograms = {}
+    counters = {}
+    gauges = {}
+    for index, data in enumerate(snapshots):
+        for name, entry in data['histograms'].items():
+            family = histograms.get(name)
+            if family is None:
+                family = histograms[name] = histogram(name, entry['help'], tuple(entry['labels']), tuple(entry['buckets']))
+            for labels, counts, total, count in entry['series']:
+                merged = family.series.setdefault(tuple(labels), [[0] * len(family.buckets), 0.0, 0])
+                merged[0] = [a + b for a, b in zip(merged[0], counts)]
+                merged[1] += total
+                merged[2] += count
+        for name, entry in data['counters'].items():
+            family = counters.get(name)
+            if family is None:
+                family = counters[name] = counter(name, entry['help'], tuple(entry['labels']))
+            for labels, value in entry['series']:
+                family.series[tuple(labels)] += value
+        # the first snapshot is this process's own
+        if index == 0 or is_alive(data['pid']):
+            for name, (help, value) in data['gauges'].items():
+                gauges[name] = (help, gauges.get(name, (help, 0.0))[1] + value)
+    return list(histograms.values()) + list(counters.values()), gauges
+
+
+def render(namespace=NAMESPACE, directory=None):
+    """All metrics of this process in the Prometheus text format, or with a directory of snapshots the
+    sums over this process and every worker that saved one there"""
+    snapshots = [snapshot()]
+    if directory is not None:
+        snapshots.extend(read_snapshots(directory))
+    families, gauges = merge_snapshots(snapshots)
+    lines = []
+    for family in families:
+        lines.extend(family.render(namespace))
+    for name, (help, value) in gauges.items():
+        full_name = namespace + "_" + name
+        lines.extend(["# HELP " + full_name + " " + help, "# TYPE " + full_name + " gauge", full_name + " " + repr(value)])
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_file(path, namespace=NAMESPACE):
+    """Save render() output to a file, for processes that do not serve /metrics themselves"""
+    with open(path + ".tmp", "w") as fp:
+        fp.write(render(namespace))
+    os.replace(path + ".tmp", path)
+
+
+class sampling_profiler:
+    """Samples the stack of one thread at a fixed interval from a background thread.
+    collapsed() returns the samples in the folded format used by flamegraph tools."""
+    def __init__(self, thread_id=None, interval=0.005):
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.interval = interval
+        self.samples = collections.Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="covid-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(os.path.basename(code.co_filename) + ":" + code.co_name)
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "\n".join(stack + " " + str(count) for stack, count in self.samples.most_common()) + "\n"
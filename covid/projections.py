@@ -0,0 +1,173 @@
+#!/usr/bin/python3
+"""Monte Carlo SIR projections (see sir.monte_carlo_projection) precomputed for every state, so the
+web app can serve them without running an integration.
+
+    python -m covid.projections --samples 2000 --states KY,OH
+
+The percentile bands of every state and projection kind are kept in one columnar file with the
+layout of historic_cache.py: one series per state, one row per "<kind>_p<percentile>" band and
+one column per projected day. data/projections_status.json tells readers whether a job is running.
+A state's projection is stale once its history has days newer than the ones it was computed from."""
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy
+
+from . import historic_cache
+from .registry import get_historic, get_state_info
+from .states import parse_date
+
+INDEX_FILE = os.path.join(historic_cache.DATA_DIR, "projections_index.json")
+STATUS_FILE = os.path.join(historic_cache.DATA_DIR, "projections_status.json")
+
+DAYS = 45
+FORECAST_TIME = 150
+SAMPLES = int(os.environ.get("COVID_PROJECTION_SAMPLES", 1000))
+PERCENTILES = (5, 50, 95)
+
+_loaded = None
+
+
+def band_name(kind, percentile):
+    return kind + "_p" + str(percentile)
+
+
+def load_projections():
+    """The current projections generation, or None if no job has finished a state yet"""
+    global _loaded
+    _loaded = historic_cache.load_store(INDEX_FILE, _loaded)
+    return _loaded
+
+
+def read_status():
+    """The status the last job wrote, with running cleared if its process has gone away"""
+    try:
+        with open(STATUS_FILE, 'r') as fp:
+            status = json.load(fp)
+    except (OSError, ValueError):
+        return {'running': False}
+    if status.get('running'):
+        try:
+            os.kill(status['pid'], 0)
+        except (OSError, KeyError):
+            status['running'] = False
+    return status
+
+
+def write_status(status):
+    with open(STATUS_FILE + ".tmp", 'w') as fp:
+        json.dump(status, fp)
+    os.replace(STATUS_FILE + ".tmp", STATUS_FILE)
+
+
+def latest_date(state):
+    history = get_historic(state)
+    return int(history.dates[-1]) if len(history) else None
+
+
+def is_stale(state, store=None):
+    """True if the state has no projection or its history has changed since it was computed"""
+    store = store if store is not None else load_projections()
+    if store is None or state not in store.series:
+        return True
+    try:
+        return store.series[state]['data_date'] != latest_date(state)
+    except OSError:
+        return False
+
+
+def project_state(state, kinds=None, samples=SAMPLES, processes=None):
+    """((dates, columns, masks), index entry) holding a state's percentile bands for every kind"""
+    from . import sir
+    data = get_historic(state).get_latest_n(DAYS)
+    if len(data.dates) < 2:
+        raise ValueError("not enough data to project " + state)
+    bootstrap = parse_date(data.dates[0])
+    dates = numpy.array([int((bootstrap + timedelta(days=day)).strftime("%Y%m%d")) for day in range(FORECAST_TIME)],
+                        dtype=numpy.int64)
+    columns = {}
+    entry = {'data_date': int(data.dates[-1]), 'computed': datetime.now(timezone.utc).isoformat(), 'kinds': {}}
+    for kind in kinds or sir.PROJECTION_KINDS:
+        bands = sir.state_projection_bands(state, kind, DAYS, forecast_time=FORECAST_TIME, samples=samples,
+                                           percentiles=PERCENTILES, processes=processes)
+        for percentile, band in zip(PERCENTILES, bands.bands):
+            columns[band_name(kind, percentile)] = band
+        entry['kinds'][kind] = {'fit': bands.fit, 'samples': bands.samples, 'change': bands.change,
+                                'wall_time': bands.wall_time}
+    masks = {name: numpy.ones(FORECAST_TIME, dtype=bool) for name in columns}
+    return (dates, columns, masks), entry
+
+
+def precompute_projections(states=None, only_stale=False, samples=SAMPLES, processes=None):
+    """Project every state (or the given ones, or with only_stale just those whose data changed) and
+    store the bands. The file is rewritten after each state, so readers see projections as they finish.
+    Returns the states projected."""
+    if states is None:
+        states = list(get_state_info().get_states())
+    store = load_projections()
+    histories = {}
+    extra = {}
+    if store is not None:
+        for state, entry in store.series.items():
+            histories[state] = store.get(state)
+            extra[state] = {name: value for name, value in entry.items() if name not in ('rows', 'columns')}
+    if only_stale:
+        states = [state for state in states if is_stale(state, store)]
+
+    status = {'running': True, 'pid': os.getpid(), 'started': datetime.now(timezone.utc).isoformat(),
+              'states': len(states), 'done': 0, 'failed': []}
+    write_status(status)
+    projected = []
+    try:
+        for state in states:
+            try:
+                histories[state], extra[state] = project_state(state, samples=samples, processes=processes)
+            except (OSError, ValueError, KeyError) as e:
+                print("ERROR: could not project " + state + ": " + str(e))
+                status['failed'].append(state)
+                continue
+            historic_cache.write_store("projections", INDEX_FILE, histories, extra)
+            projected.append(state)
+            status['done'] = len(projected)
+            write_status(status)
+    finally:
+        status.update(running=False, finished=datetime.now(timezone.utc).isoformat())
+        write_status(status)
+    return projected
+
+
+def get_projection(state, kinds=None):
+    """The stored projection of a state as a JSON-ready dict flagged with whether it is stale and whether
+    a job is running, or None if it has never been projected"""
+    store = load_projections()
+    if store is None or state not in store.series:
+        return None
+    dates, columns, _ = store.get(state)
+    entry = store.series[state]
+    output = {'state': state, 'dates': dates.tolist(), 'percentiles': list(PERCENTILES),
+              'data_date': entry['data_date'], 'computed': entry['computed'],
+              'stale': is_stale(state, store), 'running': read_status().get('running', False), 'projections': {}}
+    for kind, details in entry['kinds'].items():
+        if kinds and kind not in kinds:
+            continue
+        bands = {str(percentile): numpy.round(columns[band_name(kind, percentile)]).astype(numpy.int64).tolist()
+                 for percentile in PERCENTILES}
+        output['projections'][kind] = dict(details, bands=bands)
+    return output
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute SIR projection bands for every state")
+    parser.add_argument("--states", default=None, help="comma separated states (default every state)")
+    parser.add_argument("--samples", type=int, default=SAMPLES)
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--stale", action="store_true", help="only states whose data changed since their projection")
+    args = parser.parse_args()
+    start = time.perf_counter()
+    projected = precompute_projections(args.states.upper().split(",") if args.states else None, args.stale,
+                                       args.samples, args.processes)
+    print("Projected " + str(len(projected)) + " states in %.1fs into " % (time.perf_counter() - start) + INDEX_FILE)
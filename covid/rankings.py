@@ -0,0 +1,120 @@
+#!/usr/bin/python3
+"""Rank every state on the same metrics in one pass over a states x dates matrix.
+
+    python -m covid.rankings --top 10 --metric case_doubling_time
+    python -m covid.rankings --level county --top 25
+
+Each field of every state is placed on the union of all reported dates. A missing day repeats the
+state's previous value (the fields are cumulative), and days before a state's first report stay
+NaN. Every metric is then a column operation on the matrices, taken on the latest date."""
+
+import argparse
+import json
+
+import numpy
+
+from .calculate_trends import rolling_exponential_fit
+from .regions import align
+from .registry import get_region_info, get_state_info, get_historic
+
+FIELDS = ('positive', 'death', 'total')
+
+# metric name -> (description, True when a higher value ranks first)
+METRICS = {
+    'positive_per_100k': ("Cumulative positive cases per 100,000 residents", True),
+    'death_per_100k': ("Cumulative deaths per 100,000 residents", True),
+    'new_cases_per_100k': ("Average daily new cases over the window per 100,000 residents", True),
+    'case_doubling_time': ("Case doubling time in days over the window, fastest growth first", False),
+    'death_doubling_time': ("Death doubling time in days over the window, fastest growth first", False),
+    'pos_test_rate': ("% of tests reported positive", True),
+    'mortality_rate': ("% of positive cases resulting in death", True),
+}
+
+
+def aligned_matrix(states, fields=FIELDS):
+    """(dates, {field: states x dates matrix}) with every state on the union of their dates"""
+    return align([get_historic(state) for state in states], fields)
+
+
+def doubling_times(matrix, window):
+    """(growth rate, doubling time) of each row over its last window days"""
+    if matrix.shape[1] < window:
+        nan = numpy.full(matrix.shape[0], numpy.nan)
+        return nan, nan
+    rate, intercept, doubling = rolling_exponential_fit(matrix[:, -window:], window)
+    return rate[:, -1], doubling[:, -1]
+
+
+def compute_metrics(states, window=7):
+    """(latest date, {metric: values}, {metric: sort keys}) for every metric in METRICS, with values
+    in the order of states"""
+    si = get_region_info()
+    dates, matrices = aligned_matrix(states)
+    if len(dates) == 0:
+        values = {name: numpy.full(len(states), numpy.nan) for name in METRICS}
+        return None, values, values
+    population = numpy.array([si.get_population(state) for state in states], dtype=numpy.float64)
+    latest = {field: matrix[:, -1] for field, matrix in matrices.items()}
+    positive = matrices['positive']
+    start = max(positive.shape[1] - window - 1, 0)
+    new_cases = (positive[:, -1] - positive[:, start]) / max(positive.shape[1] - 1 - start, 1)
+
+    case_rate, case_doubling = doubling_times(positive, window)
+    death_rate, death_doubling = doubling_times(matrices['death'], window)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        values = {
+            'positive_per_100k': latest['positive'] / population * 100000,
+            'death_per_100k': latest['death'] / population * 100000,
+            'new_cases_per_100k': new_cases / population * 100000,
+            'case_doubling_time': case_doubling,
+            'death_doubling_time': death_doubling,
+            'pos_test_rate': latest['positive'] / latest['total'] * 100,
+            'mortality_rate': latest['death'] / latest['positive'] * 100,
+        }
+    # doubling times are ranked by growth rate, so shrinking (negative) rates come after slow growth
+    sort_keys = dict(values, case_doubling_time=-case_rate, death_doubling_time=-death_rate)
+    return int(dates[-1]), values, sort_keys
+
+
+def ranked(states, values, sort_key, descending, top=None):
+    """[{'rank', 'state', 'value'}] best first, states without a value last and unranked"""
+    key = numpy.where(numpy.isfinite(sort_key), -sort_key if descending else sort_key, numpy.inf)
+    order = numpy.argsort(key, kind='stable')
+    if top is not None:
+        order = order[:top]
+    rows = []
+    for position, i in enumerate(order.tolist()):
+        value = values[i].item()
+        finite = bool(numpy.isfinite(key[i]))
+        rows.append({'rank': position + 1 if finite else None, 'state': states[i],
+                     'value': value if numpy.isfinite(value) else None})
+    return rows
+
+
+def state_rankings(states=None, metrics=None, top=None, window=7):
+    """Ranked tables for the given metrics (default all) over the given states (default all in
+    states.json). Any region IDs can be ranked against each other in place of states."""
+    if states is None:
+        states = list(get_state_info().get_states())
+    metrics = list(METRICS) if metrics is None else metrics
+    unknown = [name for name in metrics if name not in METRICS]
+    if unknown:
+        raise ValueError("unknown metric " + ", ".join(unknown) + ", expected one of " + ", ".join(METRICS))
+    date, values, sort_keys = compute_metrics(states, window)
+    tables = {}
+    for name in metrics:
+        description, descending = METRICS[name]
+        tables[name] = {'description': description,
+                        'ranking': ranked(states, values[name], sort_keys[name], descending, top)}
+    return {'date': date, 'window': window, 'metrics': tables}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rank all states on per-capita and growth metrics")
+    parser.add_argument("--metric", action="append", default=None, choices=list(METRICS))
+    parser.add_argument("--top", type=int, default=None)
+    parser.add_argument("--window", type=int, default=7)
+    parser.add_argument("--level", default='state', choices=['state', 'county'], help="rank states or counties")
+    args = parser.parse_args()
+    regions = None if args.level == 'state' else get_region_info().get_regions(args.level)
+    print(json.dumps(state_rankings(regions, args.metric, args.top, args.window), indent=2))
@@ -0,0 +1,272 @@
+#!/usr/bin/python3
+"""The region hierarchy: the nation, its states and their counties, each identified by a region ID.
+
+    US          the nation
+    KY          a state, as in data/states.json
+    KY-21111    a county: its state's code and its 5 digit FIPS code
+
+data/regions.json adds names, areas and populations for regions other than the states. Each level
+keeps the histories of all its regions in one consolidated columnar file (see historic_cache.py):
+states in data/historic_index.json, counties in data/county_index.json and the nation in
+data/nation_index.json. A region without a stored history is the sum of its children's, so the
+nation and any state without a JSON file of its own come from their counties.
+
+    python -m covid.regions --import-counties us-counties.csv --rollup"""
+
+import argparse
+import csv
+import json
+import os
+
+import numpy
+
+from . import historic_cache
+from .states import state_info
+
+NATION = "US"
+LEVELS = ('nation', 'state', 'county')
+REGIONS_FILE = os.path.join(historic_cache.DATA_DIR, "regions.json")
+LEVEL_FILES = {'nation': os.path.join(historic_cache.DATA_DIR, "nation_index.json"),
+               'state': historic_cache.INDEX_FILE,
+               'county': os.path.join(historic_cache.DATA_DIR, "county_index.json")}
+
+_stores = {}
+
+
+def region_level(region_id):
+    if region_id == NATION:
+        return 'nation'
+    if '-' in region_id:
+        return 'county'
+    return 'state'
+
+
+def parent_id(region_id):
+    level = region_level(region_id)
+    if level == 'county':
+        return region_id.split('-', 1)[0]
+    if level == 'state':
+        return NATION
+    return None
+
+
+def child_level(level):
+    i = LEVELS.index(level)
+    return LEVELS[i + 1] if i + 1 < len(LEVELS) else None
+
+
+class region_info(state_info):
+    """state_info for every region. get_states() still lists only the states; get_regions() lists
+    any level. Areas and populations missing for a region are the sums of its children's, or NaN when
+    it has no children (county CSVs carry no populations), so per-capita figures come out as NaN."""
+    def __init__(self, datafile="data/states.json", regions_file=REGIONS_FILE):
+        super().__init__(datafile)
+        self.regions = {NATION: {'name': "United States"}}
+        for state, entry in self.data.items():
+            self.regions[state] = dict(entry)
+        try:
+            with open(regions_file, 'r') as fp:
+                for region, entry in json.load(fp).items():
+                    self.regions[region] = dict(self.regions.get(region, {}), **entry)
+        except OSError:
+            pass
+        self.children = {}
+        for region in self.regions:
+            parent = parent_id(region)
+            if parent is not None:
+                self.children.setdefault(parent, []).append(region)
+
+    def get_regions(self, level=None):
+        """Region IDs of one level, or of every level"""
+        return [region for region in self.regions if level is None or region_level(region) == level]
+
+    def has_region(self, region):
+        return region in self.regions
+
+    def get_children(self, region):
+        return self.children.get(region, [])
+
+    def get_name(self, region):
+        return self.regions[region]['name']
+
+    def get_area(self, region):
+        return self._get_total(region, 'area')
+
+    def get_population(self, region):
+        return self._get_total(region, 'population')
+
+    def _get_total(self, region, name):
+        entry = self.regions[region]
+        if name in entry:
+            return entry[name]
+        children = self.get_children(region)
+        if not children:
+            return float('nan')
+        return sum(self._get_total(child, name) for child in children)
+
+
+def load_level(level):
+    """The current column_store of a level, or None if the level has not been written"""
+    if level == 'state':
+        return historic_cache.load_cache()
+    _stores[level] = historic_cache.load_store(LEVEL_FILES[level], _stores.get(level))
+    return _stores[level]
+
+
+def file_version(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def region_version(region_id):
+    """Changes whenever the data a region's history is read or summed from changes"""
+    level = region_level(region_id)
+    if level == 'state':
+        version = file_version(historic_cache.json_path(region_id))
+        if version is not None:
+            return version
+    below = child_level(level)
+    return (file_version(LEVEL_FILES[level]), file_version(LEVEL_FILES[below]) if below else None)
+
+
+def stored_columns(region_id):
+    """(dates, columns, masks) of a region from its level's file, or None if it is not stored there or
+    was summed from children that have changed since"""
+    store = load_level(region_level(region_id))
+    if store is None or region_id not in store.series:
+        return None
+    entry = store.series[region_id]
+    below = child_level(region_level(region_id))
+    if 'source_version' in entry and below and entry['source_version'] != file_version(LEVEL_FILES[below]):
+        return None
+    return store.get(region_id)
+
+
+def forward_fill(matrix):
+    """Replace NaN with the last earlier value in the same row; leading NaN are kept"""
+    present = ~numpy.isnan(matrix)
+    index = numpy.where(present, numpy.arange(matrix.shape[1]), 0)
+    numpy.maximum.accumulate(index, axis=1, out=index)
+    return matrix[numpy.arange(matrix.shape[0])[:, None], index]
+
+
+def align(histories, fields):
+    """(dates, {field: histories x dates matrix}) with every history on the union of their dates.
+    A missing day repeats the previous value (the fields are cumulative); days before the first
+    report stay NaN."""
+    all_dates = numpy.concatenate([history.dates for history in histories] + [numpy.empty(0, dtype=numpy.int64)])
+    dates = numpy.unique(all_dates)
+    # one scatter per field for all histories at once
+    rows = numpy.repeat(numpy.arange(len(histories)), [len(history.dates) for history in histories])
+    positions = numpy.searchsorted(dates, all_dates)
+    matrices = {}
+    for field in fields:
+        matrix = numpy.full((len(histories), len(dates)), numpy.nan)
+        if histories:
+            mask = numpy.concatenate([history.mask(field) for history in histories])
+            values = numpy.concatenate([history.column(field) for history in histories])
+            matrix[rows[mask], positions[mask]] = values[mask]
+        matrices[field] = forward_fill(matrix)
+    return dates, matrices
+
+
+def rollup(histories):
+    """(dates, columns, masks) summing the histories day by day. A day has a value wherever any of
+    them has reported the field by then."""
+    fields = sorted(set(name for history in histories for name in history.columns))
+    dates, matrices = align(histories, fields)
+    columns = {}
+    masks = {}
+    for field, matrix in matrices.items():
+        present = ~numpy.isnan(matrix)
+        masks[field] = present.any(axis=0)
+        columns[field] = numpy.where(present, matrix, 0).sum(axis=0)
+    return dates, columns, masks
+
+
+def write_level(level, histories, source_version=None):
+    """Store {region id: (dates, columns, masks)} as the consolidated file of a level"""
+    extra = None
+    if source_version is not None:
+        extra = {region: {'source_version': source_version} for region in histories}
+    historic_cache.write_store(level, LEVEL_FILES[level], histories, extra)
+
+
+def write_rollups(level, get_historic, info):
+    """Sum the children of every region of a level into that level's file. get_historic loads a child;
+    children without any history are left out."""
+    below = child_level(level)
+    histories = {}
+    for region in info.get_regions(level):
+        children = []
+        for child in info.get_children(region):
+            try:
+                children.append(get_historic(child))
+            except OSError:
+                pass
+        if children:
+            histories[region] = rollup(children)
+    write_level(level, histories, file_version(LEVEL_FILES[below]))
+    return list(histories)
+
+
+def read_counties_csv(path, info):
+    """{county id: (dates, columns, masks)} from a county CSV with date, state (name), fips, cases and
+    deaths columns, as published by the New York Times. Rows without a FIPS code are skipped."""
+    state_codes = {info.get_name(state): state for state in info.get_states()}
+    rows = {}
+    with open(path, 'r', newline='') as fp:
+        for row in csv.DictReader(fp):
+            state = state_codes.get(row['state'])
+            if state is None or not row['fips']:
+                continue
+            county = rows.setdefault(state + "-" + row['fips'].zfill(5), {'name': row['county'], 'days': []})
+            county['days'].append((int(row['date'].replace("-", "")), row['cases'], row['deaths']))
+
+    histories = {}
+    names = {}
+    for county, entry in rows.items():
+        days = sorted(entry['days'])
+        dates = numpy.array([day[0] for day in days], dtype=numpy.int64)
+        columns = {}
+        masks = {}
+        for name, i in (('positive', 1), ('death', 2)):
+            masks[name] = numpy.array([day[i] != "" for day in days], dtype=bool)
+            columns[name] = numpy.array([float(day[i]) if day[i] != "" else 0.0 for day in days])
+        histories[county] = (dates, columns, masks)
+        names[county] = entry['name']
+    return histories, names
+
+
+def import_counties(path, regions_file=REGIONS_FILE):
+    """Replace the county level with the histories in a county CSV and add the counties to regions.json,
+    keeping any populations and areas already there. Returns the county ids imported."""
+    info = region_info()
+    histories, names = read_counties_csv(path, info)
+    write_level('county', histories)
+    try:
+        with open(regions_file, 'r') as fp:
+            regions = json.load(fp)
+    except OSError:
+        regions = {}
+    for county, name in names.items():
+        regions.setdefault(county, {})['name'] = name
+    with open(regions_file + ".tmp", 'w') as fp:
+        json.dump(regions, fp, indent=2)
+    os.replace(regions_file + ".tmp", regions_file)
+    return list(histories)
+
+
+if __name__ == "__main__":
+    from .registry import get_historic, get_region_info
+
+    parser = argparse.ArgumentParser(description="Import county histories and roll regions up")
+    parser.add_argument("--import-counties", default=None, help="county CSV (date,county,state,fips,cases,deaths)")
+    parser.add_argument("--rollup", action="store_true", help="store the nation as the sum of the states")
+    args = parser.parse_args()
+    if args.import_counties:
+        print("Imported " + str(len(import_counties(args.import_counties))) + " counties into " + LEVEL_FILES['county'])
+    if args.rollup:
+        print("Stored " + ", ".join(write_rollups('nation', get_historic, get_region_info())) + " in " + LEVEL_FILES['nation'])
@@ -0,0 +1,107 @@
+"""Process-wide cache of loaded state_info and state_historic_data objects.
+
+Entries are shared between callers and threads and must be treated as read-only. An entry is
+reloaded when its file's mtime changes or after invalidate() is called for it, so each file is
+parsed once per refresh instead of once per request."""
+
+import os
+import threading
+from collections import OrderedDict
+
+from . import historic_cache
+from . import metrics
+from . import regions
+from .states import state_info, state_historic_data
+
+# large enough for every county; entries are mostly views into the mapped level files
+MAX_ENTRIES = int(os.environ.get("COVID_REGISTRY_SIZE", 4096))
+
+
+class data_registry:
+    """Bounded LRU of loaded data keyed by file, with hit/miss counters"""
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        # reentrant because a rollup loads its children while its own entry is being loaded
+        self._lock = threading.RLock()
+
+    def get_state_info(self, datafile="data/states.json"):
+        return self._get(('info', datafile), regions.file_version(datafile), lambda: state_info(datafile))
+
+    def get_region_info(self, datafile="data/states.json"):
+        version = (regions.file_version(datafile), regions.file_version(regions.REGIONS_FILE))
+        return self._get(('regions', datafile), version, lambda: regions.region_info(datafile))
+
+    def get_historic(self, state):
+        """History of a state, or of any other region ID (see regions.py)"""
+        return self._get(('historic', state), regions.region_version(state), lambda: self._load_historic(state))
+
+    def _load_historic(self, region):
+        if regions.region_level(region) == 'state' and os.path.exists(historic_cache.json_path(region)):
+            return state_historic_data(region)
+        columns = regions.stored_columns(region)
+        if columns is None:
+            children = []
+            for child in self.get_region_info().get_children(region):
+                try:
+                    children.append(self.get_historic(child))
+                except OSError:
+                    pass
+            if not children:
+                raise FileNotFoundError("no history for region " + region)
+            columns = regions.rollup(children)
+        return state_historic_data(region, columns)
+
+    def invalidate(self, states=None):
+        """Drop the given states' histories, or every entry if states is None, and start a new generation"""
+        with self._lock:
+            self.generation += 1
+            if states is None:
+                self._entries.clear()
+            else:
+                for state in states:
+                    self._entries.pop(('historic', state), None)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'generation': self.generation, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def _get(self, key, version, load):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            # loading under the lock makes concurrent requests for the same file wait for one parse
+            self.misses += 1
+            value = load()
+            self._entries[key] = (version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            return value
+
+
+registry = data_registry()
+metrics.register_gauge("registry_hits", "Loads answered from the data registry", lambda: registry.hits)
+metrics.register_gauge("registry_misses", "Loads that parsed or mapped a file", lambda: registry.misses)
+metrics.register_gauge("registry_evictions", "Entries dropped from the data registry", lambda: registry.evictions)
+
+
+def get_state_info(datafile="data/states.json"):
+    return registry.get_state_info(datafile)
+
+
+def get_region_info(datafile="data/states.json"):
+    return registry.get_region_info(datafile)
+
+
+def get_historic(state):
+    return registry.get_historic(state)
@@ -0,0 +1,101 @@
+#!/usr/bin/python3
+"""Render build_graphs charts to PNG files without a display, across a process pool.
+
+Each job is (chart kind, states, options) where options are keyword arguments of the plot function.
+Every chart gets its own Figure that is not registered with pyplot, so it is freed as soon as it
+has been saved and nothing accumulates in long batch runs."""
+
+import argparse
+import hashlib
+import json
+import os
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+matplotlib.use("Agg")
+from matplotlib.figure import Figure
+
+from . import build_graphs
+
+CHART_KINDS = {
+    'trend': build_graphs.plot_states_trend,
+    'growth': build_graphs.plot_states_growth,
+    'pos_test_rate': build_graphs.plot_pos_test_rate,
+    'mortality_rate': build_graphs.plot_mortality_rate,
+}
+
+
+class render_result:
+    """Where a chart was written, how long it took and the peak RSS of the process that rendered it"""
+    def __init__(self, kind, states, path, seconds, peak_rss_kb, error=None):
+        self.kind = kind
+        self.states = states
+        self.path = path
+        self.seconds = seconds
+        self.peak_rss_kb = peak_rss_kb
+        self.error = error
+
+
+def chart_filename(kind, states, options):
+    """Stable file name for a job, so re-rendering after a refresh overwrites the previous chart"""
+    key = json.dumps(options, sort_keys=True).encode()
+    return kind + "_" + "-".join(states) + "_" + hashlib.sha1(key).hexdigest()[:8] + ".png"
+
+
+def render_figure(kind, states, options, fp, format="png"):
+    """Draw one chart on a new Figure and write it to a file name or file object"""
+    fig = Figure(figsize=(10, 7))
+    CHART_KINDS[kind](states, ax=fig.subplots(), **options)
+    fig.savefig(fp, format=format, dpi=100)
+
+
+def render_job(job, output_dir):
+    kind, states, options = job
+    path = os.path.join(output_dir, chart_filename(kind, states, options))
+    start = time.perf_counter()
+    error = None
+    try:
+        render_figure(kind, states, options, path)
+    except Exception as e:
+        error = type(e).__name__ + ": " + str(e)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return render_result(kind, list(states), path, time.perf_counter() - start, peak, error)
+
+
+def render_jobs(jobs, output_dir="output", processes=None):
+    """Render every job into output_dir across a process pool and return the render_results in job order"""
+    os.makedirs(output_dir, exist_ok=True)
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(render_job, jobs, [output_dir] * len(jobs)))
+
+
+def state_jobs(states, days=30):
+    """One chart of every kind for each state on its own"""
+    jobs = []
+    for state in states:
+        jobs.append(('trend', [state], {'days': 0, 'pop_adjusted': True, 'trendline': False}))
+        jobs.append(('trend', [state], {'days': days}))
+        jobs.append(('growth', [state], {}))
+        jobs.append(('pos_test_rate', [state], {'days': days}))
+        jobs.append(('mortality_rate', [state], {'days': days}))
+    return jobs
+
+
+if __name__ == "__main__":
+    from .registry import get_state_info
+
+    parser = argparse.ArgumentParser(description="Render charts for every state")
+    parser.add_argument("--output-dir", default="output")
+    parser.add_argument("--processes", type=int, default=None)
+    parser.add_argument("--days", type=int, default=30)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    results = render_jobs(state_jobs(list(get_state_info().get_states()), args.days), args.output_dir, args.processes)
+    for result in results:
+        print("%s,%s,%.3f,%d%s" % (result.kind, "-".join(result.states), result.seconds, result.peak_rss_kb,
+                                   "," + result.error if result.error else ""))
+    children_peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print("Rendered %d charts in %.2fs, peak worker RSS %d KB" % (len(results), time.perf_counter() - start, children_peak))
@@ -0,0 +1,515 @@
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import logging
+import sys
+import time as timer
+import numpy
+from . import metrics
+from .states import three_day_average, parse_date
+from .registry import get_region_info, get_historic
+import datetime
+
+logger = logging.getLogger(__name__)
+
+
+def sir_model(y,t,N,beta,gamma):
+    S,I,R = y
+    dSdt = -beta * S * I / N
+    dIdt = beta * S * I / N - gamma * I
+    dRdt = gamma * I
+    return dSdt, dIdt, dRdt
+
+
+def sir_integrate(init, time, params):
+    from scipy.integrate import odeint
+    Sinit, Iinit, Rinit = init
+    population = Sinit + Iinit + Rinit
+    beta, gamma = params
+    model = odeint(sir_model, init, numpy.arange(time), args=(population, beta, gamma))
+    return model.T
+
+
+def sir_derivatives(y, N, beta, gamma):
+    """sir_model for an (n, 3) array of states with per-member N, beta and gamma"""
+    infections = beta * y[:, 0] * y[:, 1] / N
+    recoveries = gamma * y[:, 1]
+    return numpy.stack((-infections, infections - recoveries, recoveries), axis=1)
+
+
+def sir_integrate_ensemble(inits, time, params, steps_per_day=4):
+    """Integrate many SIR parameter sets at once with fixed-step RK4.
+
+    inits is (n, 3) of (Sinit, Iinit, Rinit) and params (n, 2) of (beta, gamma); either may be a single
+    row that is shared by every member. Returns an (n, 3, time) array of daily S, I, R, the same
+    layout as stacking sir_integrate results. Each day is split into steps_per_day RK4 steps."""
+    inits = numpy.atleast_2d(numpy.asarray(inits, dtype=numpy.float64))
+    params = numpy.atleast_2d(numpy.asarray(params, dtype=numpy.float64))
+    n = max(len(inits), len(params))
+    y = numpy.broadcast_to(inits, (n, 3)).copy()
+    beta = numpy.broadcast_to(params[:, 0], (n,))
+    gamma = numpy.broadcast_to(params[:, 1], (n,))
+    N = y.sum(axis=1)
+
+    h = 1.0 / steps_per_day
+    output = numpy.empty((n, 3, time))
+    if time > 0:
+        output[:, :, 0] = y
+    for day in range(1, time):
+        for step in range(steps_per_day):
+            k1 = sir_derivatives(y, N, beta, gamma)
+            k2 = sir_derivatives(y + h / 2 * k1, N, beta, gamma)
+            k3 = sir_derivatives(y + h / 2 * k2, N, beta, gamma)
+            k4 = sir_derivatives(y + h * k3, N, beta, gamma)
+            y = y + h / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+        output[:, :, day] = y
+    return output
+
+
+def ensemble_error(inits, time, params, steps_per_day=4):
+    """Largest difference between sir_integrate_ensemble and sir_integrate (odeint) over all members
+    and days, relative to each member's population"""
+    inits = numpy.atleast_2d(numpy.asarray(inits, dtype=numpy.float64))
+    params = numpy.atleast_2d(numpy.asarray(params, dtype=numpy.float64))
+    ensemble = sir_integrate_ensemble(inits, time, params, steps_per_day)
+    worst = 0.0
+    for i in range(len(ensemble)):
+        init = inits[i % len(inits)]
+        reference = sir_integrate(init, time, params[i % len(params)])
+        worst = max(worst, numpy.max(numpy.abs(ensemble[i] - reference)) / numpy.sum(init))
+    return worst
+
+
+def model_error(real_data, model_data):
+    if len(real_data) < len(model_data):
+        delta = numpy.array(real_data) - numpy.array(model_data[:len(real_data)])
+    else:
+        delta = numpy.array(real_data[:len(model_data)]) - numpy.array(model_data)
+    return numpy.sum(delta**2)/100000
+
+
+@metrics.timed_function('sir.gradient_descent')
+def sir_gradient_descent(model_init, model_time, initial_params, real_data, verbose=True):
+    Sinit, Iinit, Rinit = model_init
+    b,g = initial_params
+    b_learning_rate = 0.001
+    b_threshold = 0.000001
+    S_learning_rate = 10000
+    S_threshold = 1
+    iteration = 0
+    S, I, R = sir_integrate((Sinit, Iinit, Rinit), model_time, (b,g))
+    error = model_error(real_data, I+R)
+    while (b_learning_rate > b_threshold or S_learning_rate > S_threshold) and iteration < 10000:
+        if verbose:
+            print("iteration {i:d}: beta={b:f}, Sinit={S:f} => error={e:f}".format(i=iteration, b=b, S=Sinit, e=error))
+        iteration = iteration + 1
+
+        # search cardinal directions on the b, S axis to find the next step
+        S1,I1,R1 = sir_integrate((Sinit, Iinit, Rinit), model_time, (b + (b_learning_rate * error), g))
+        error1 = model_error(real_data, I1+R1)
+        grad1 = (error1 - error)/b_learning_rate
+
+        # S2,I2,R2 = sir_integrate((Sinit + (S_learning_rate * error), Iinit, Rinit), model_time, (b, g))
+        # error2 = model_error(real_data, I2)
+        # grad2 = (error2 - error)/S_learning_rate
+
+        S3,I3,R3 = sir_integrate((Sinit, Iinit, Rinit), model_time, (b - (b_learning_rate * error), g))
+        error3 = model_error(real_data, I3+R3)
+        grad3 = (error3 - error)/b_learning_rate
+
+        # S4,I4,R4 = sir_integrate((Sinit - (S_learning_rate * error), Iinit, Rinit), model_time, (b, g))
+        # error4 = model_error(real_data, I4)
+        # grad4 = (error4 - error)/S_learning_rate
+
+        # whichever one has the lowest, move that direction unless it causes beta or S to be < 0.
+        # if no moves are available, halve the learning rate.
+        # min_grad = numpy.min([grad1,grad2,grad3,grad4])
+        min_grad = numpy.min([grad1,grad3])
+        # if the other points are all worse halve the learning rate
+        if min_grad > 0:
+            b_learning_rate = b_learning_rate / 2
+            S_learning_rate = S_learning_rate / 2
+            if verbose:
+                print("iteration {i:d}: learning rate decreased to {blr:f}|{Slr:f}".format(i=iteration, blr=b_learning_rate, Slr=S_learning_rate))
+        elif min_grad == grad1 and b + (b_learning_rate * error) > 0:
+            b = b + (b_learning_rate * error)
+            error = error1
+            S, I, R = S1, I1, R1
+        # elif min_grad == grad2 and Sinit + (S_learning_rate * error) > 0:
+        #     Sinit = Sinit + (S_learning_rate * error)
+        #     error = error2
+        #     S, I, R = S2, I2, R2
+        elif min_grad == grad3 and b - (b_learning_rate * error) > 0:
+            b = b - (b_learning_rate * error)
+            error = error3
+            S, I, R = S3, I3, R3
+        # elif min_grad == grad4 and Sinit - (S_learning_rate * error) > 0:
+        #     Sinit = Sinit - (S_learning_rate * error)
+        #     error = error4
+        #     S, I, R = S4, I4, R4
+        else:
+            b_learning_rate = b_learning_rate / 2
+            S_learning_rate = S_learning_rate / 2
+            if verbose:
+                print("iteration {i:d}: learning rate decreased to {blr:f}|{Slr:f}".format(i=iteration, blr=b_learning_rate, Slr=S_learning_rate))
+    if verbose:
+        print("iteration {i:d}: beta={b:f}, Sinit={S:f} => error={e:f}".format(i=iteration, b=b, S=Sinit, e=error))
+    return b,Sinit,S,I,R
+
+
+class sir_fit_result:
+    """Fitted parameters of one SIR fit plus how much work the fit took"""
+    def __init__(self, beta, gamma, s_init, error, wall_time, integrations, iterations, success, message, job=None):
+        self.beta = beta
+        self.gamma = gamma
+        self.s_init = s_init
+        self.error = error
+        self.wall_time = wall_time
+        self.integrations = integrations
+        self.iterations = iterations
+        self.success = success
+        self.message = message
+        self.job = job
+
+    def as_dict(self):
+        return dict(vars(self))
+
+
+@metrics.timed_function('sir.fit')
+def fit_sir(real_data, model_init, initial_params=(0.2, 0.15), method="L-BFGS-B", model_time=None):
+    """Fit beta, gamma and Sinit jointly so that I+R follows real_data (cumulative infections).
+
+    method is any scipy.optimize.minimize method name ("L-BFGS-B", "Nelder-Mead", "Powell", ...),
+    "gradient_descent" for sir_gradient_descent (beta only), or a callable
+    optimizer(objective, x0, bounds) returning an object with x, fun, nit, success and message like
+    scipy's OptimizeResult. model_time defaults to the length of real_data, the days that affect the error.
+    Nothing is printed; progress is logged at DEBUG level on the "sir" logger."""
+    Sinit, Iinit, Rinit = model_init
+    if model_time is None:
+        model_time = len(real_data)
+    start = timer.perf_counter()
+    integrations = [0]
+
+    if method == "gradient_descent":
+        b, Sinit, S, I, R = sir_gradient_descent(model_init, model_time, initial_params, real_data, verbose=False)
+        return sir_fit_result(b, initial_params[1], Sinit, model_error(real_data, I + R),
+                              timer.perf_counter() - start, None, None, True, "gradient descent finished")
+
+    # optimise Sinit as a multiple of its starting value so all three parameters have similar scales
+    s_scale = Sinit if Sinit > 0 else 1.0
+
+    def objective(x):
+        integrations[0] += 1
+        S, I, R = sir_integrate((x[2] * s_scale, Iinit, Rinit), model_time, (x[0], x[1]))
+        error = model_error(real_data, I + R)
+        logger.debug("fit step", extra={'sir_step': {'beta': x[0], 'gamma': x[1], 's_init': x[2] * s_scale, 'error': error}})
+        return error
+
+    x0 = numpy.array([initial_params[0], initial_params[1], 1.0])
+    bounds = [(1e-6, 5.0), (1e-6, 1.0), (1e-6, 10.0)]
+    if callable(method):
+        result = method(objective, x0, bounds)
+    elif method in ("L-BFGS-B", "TNC", "SLSQP", "Powell", "Nelder-Mead", "trust-constr"):
+        from scipy.optimize import minimize
+        result = minimize(objective, x0, method=method, bounds=bounds)
+    else:
+        from scipy.optimize import minimize
+        result = minimize(objective, x0, method=method)
+
+    beta, gamma, s_ratio = result.x
+    fit = sir_fit_result(float(beta), float(gamma), float(s_ratio * s_scale), float(result.fun),
+                         timer.perf_counter() - start, integrations[0], int(getattr(result, 'nit', 0)),
+                         bool(result.success), str(result.message))
+    logger.info("fit finished", extra={'sir_fit': fit.as_dict()})
+    return fit
+
+
+def scenario_inputs(state, days=45, social_distancing_factor=0.9):
+    """Cumulative cases and (Sinit, Iinit, Rinit) for a state's last days, with the susceptible population
+    reduced by social_distancing_factor as in projection_cumulative_cases"""
+    population = get_region_info().get_population(state)
+    data = get_historic(state).get_latest_n(days)
+    cases = data['positive']
+    deaths = data['death']
+    recovered = data['recovered']
+    Sinit = (population - cases[0] - recovered[0]) * (1 - social_distancing_factor)
+    return cases, (Sinit, cases[0] - deaths[0], recovered[0] + deaths[0])
+
+
+def fit_scenario(job):
+    """Fit one job: a dict with 'state' and optionally 'social_distancing_factor', 'days', 'method' and 'initial_params'"""
+    cases, init = scenario_inputs(job['state'], job.get('days', 45), job.get('social_distancing_factor', 0.9))
+    fit = fit_sir(cases, init, job.get('initial_params', (0.2, 0.15)), job.get('method', "L-BFGS-B"))
+    fit.job = job
+    return fit
+
+
+def fit_many(jobs, processes=None):
+    """Run fit_scenario for every job on a process pool and return the sir_fit_results in job order"""
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        return list(executor.map(fit_scenario, jobs))
+
+
+# distributions the Monte Carlo projections sample their inputs from: ('uniform', low, high) or, for the
+# fitted beta and gamma, ('lognormal', sigma) around the fitted value
+PROJECTION_DISTRIBUTIONS = {
+    'social_distancing_factor': ('uniform', 0.85, 0.95),
+    'testing_coverage': ('uniform', 0.1, 0.3),
+    'mortality_rate': ('uniform', 0.01, 0.05),
+    'beta': ('lognormal', 0.1),
+    'gamma': ('lognormal', 0.1),
+}
+PROJECTION_KINDS = ('cases', 'undertesting', 'deaths')
+
+
+def sample_inputs(n, rng, distributions, fitted):
+    """{input name: n samples} drawn from distributions; fitted holds the fitted beta and gamma that the
+    lognormal ones are centred on"""
+    samples = {}
+    for name, distribution in distributions.items():
+        if distribution[0] == 'uniform':
+            samples[name] = rng.uniform(distribution[1], distribution[2], n)
+        elif distribution[0] == 'lognormal':
+            samples[name] = fitted[name] * rng.lognormal(0.0, distribution[1], n)
+        else:
+            raise ValueError("unknown distribution " + str(distribution[0]) + " for " + name)
+    return samples
+
+
+def projection_inits(kind, population, cases, deaths, recovered, samples):
+    """(n, 3) starting S, I, R for each sample of a projection kind, set up as projection_cumulative_cases,
+    projection_undertesting_cases and projection_deaths do, and the (n, days) data each one is fitted to"""
+    if kind == 'cases':
+        infected = numpy.broadcast_to(numpy.asarray(cases, dtype=numpy.float64), (len(samples['social_distancing_factor']), len(cases)))
+        removed = recovered[0]
+    elif kind == 'undertesting':
+        infected = numpy.asarray(cases, dtype=numpy.float64) / samples['testing_coverage'][:, None]
+        removed = recovered[0] / samples['testing_coverage']
+    elif kind == 'deaths':
+        infected = numpy.asarray(deaths, dtype=numpy.float64) / samples['mortality_rate'][:, None]
+        removed = recovered[0]
+    else:
+        raise ValueError("projection kind must be one of " + ", ".join(PROJECTION_KINDS) + ", got " + str(kind))
+    Sinit = (population - infected[:, 0] - removed) * (1 - samples['social_distancing_factor'])
+    inits = numpy.column_stack([Sinit, infected[:, 0] - deaths[0], numpy.full(len(Sinit), recovered[0] + deaths[0])])
+    return inits, infected
+
+
+def integrate_projection(job):
+    """Cumulative infections (I+R) of one batch of samples; runs in a worker process when sampling in parallel"""
+    inits, time, params, steps_per_day = job
+    model = sir_integrate_ensemble(inits, time, params, steps_per_day)
+    return model[:, 1] + model[:, 2]
+
+
+class projection_bands:
+    """Percentile bands of the trajectories sampled so far. bands is (percentiles, days) of cumulative
+    infections; change is the largest move of any band since the previous batch relative to the peak of
+    the median, which settles towards 0 as the bands converge."""
+    def __init__(self, kind, percentiles, bands, samples, batches, wall_time, change, fit):
+        self.kind = kind
+        self.percentiles = percentiles
+        self.bands = bands
+        self.samples = samples
+        self.batches = batches
+        self.wall_time = wall_time
+        self.cost_per_sample = wall_time / samples if samples else None
+        self.change = change
+        self.fit = fit
+
+    def band(self, percentile):
+        return self.bands[list(self.percentiles).index(percentile)]
+
+    def as_dict(self):
+        result = dict(vars(self))
+        result['percentiles'] = list(self.percentiles)
+        result['bands'] = self.bands.tolist()
+        return result
+
+
+def monte_carlo_projection(kind, population, cases, deaths, recovered, forecast_time=150, samples=2000, batch_size=250,
+                           percentiles=(5, 50, 95), distributions=None, fit=None, seed=None, processes=None,
+                           steps_per_day=4, method="L-BFGS-B"):
+    """Sample the projection inputs (see PROJECTION_DISTRIBUTIONS) and integrate every sample with
+    sir_integrate_ensemble, yielding a projection_bands after each batch so partial bands are available
+    early. kind is 'cases', 'undertesting' or 'deaths' like the projection_* functions.
+
+    beta and gamma are centred on a fit_sir (with method) of the data at the central input values unless fit gives
+    (beta, gamma, s_ratio), where s_ratio scales every sample's Sinit as the fit scaled the central one.
+    The fit's time is reported in fit['wall_time'] and left out of wall_time and cost_per_sample.
+    With processes, batches are integrated on a process pool and still yielded in order."""
+    distributions = dict(PROJECTION_DISTRIBUTIONS, **(distributions or {}))
+    rng = numpy.random.default_rng(seed)
+    start = timer.perf_counter()
+    fit_time = 0.0
+
+    if fit is None:
+        central = {name: numpy.array([(distribution[1] + distribution[2]) / 2])
+                   for name, distribution in distributions.items() if distribution[0] == 'uniform'}
+        inits, infected = projection_inits(kind, population, cases, deaths, recovered, central)
+        result = fit_sir(infected[0], tuple(inits[0]), method=method)
+        fit = (result.beta, result.gamma, result.s_init / inits[0][0] if inits[0][0] else 1.0)
+        fit_time = timer.perf_counter() - start
+        start = timer.perf_counter()
+    beta, gamma, s_ratio = (float(x) for x in fit)
+
+    def jobs():
+        for first in range(0, samples, batch_size):
+            drawn = sample_inputs(min(batch_size, samples - first), rng, distributions, {'beta': beta, 'gamma': gamma})
+            inits, infected = projection_inits(kind, population, cases, deaths, recovered, drawn)
+            inits[:, 0] *= s_ratio
+            yield inits, forecast_time, numpy.column_stack([drawn['beta'], drawn['gamma']]), steps_per_day
+
+    trajectories = numpy.empty((samples, forecast_time))
+    done = 0
+    previous = None
+    executor = ProcessPoolExecutor(max_workers=processes) if processes else None
+    try:
+        batches = executor.map(integrate_projection, jobs()) if executor else map(integrate_projection, jobs())
+        for batch, infections in enumerate(batches, 1):
+            with metrics.timed('sir.projection_percentiles.' + kind):
+                trajectories[done:done + len(infections)] = infections
+                done += len(infections)
+                bands = numpy.percentile(trajectories[:done], percentiles, axis=0)
+            change = None
+            if previous is not None:
+                scale = numpy.max(numpy.abs(bands[len(percentiles) // 2])) or 1.0
+                change = float(numpy.max(numpy.abs(bands - previous)) / scale)
+            previous = bands
+            yield projection_bands(kind, percentiles, bands, done, batch, timer.perf_counter() - start, change,
+                                   {'beta': beta, 'gamma': gamma, 's_ratio': s_ratio, 'wall_time': fit_time})
+    finally:
+        if executor:
+            executor.shutdown()
+
+
+def state_projection_bands(state, kind='cases', days=45, **options):
+    """The final projection_bands of monte_carlo_projection for a state's last days of data"""
+    data = get_historic(state).get_latest_n(days)
+    bands = None
+    for bands in monte_carlo_projection(kind, get_region_info().get_population(state), data['positive'],
+                                        data['death'], data['recovered'], **options):
+        pass
+    return bands
+
+
+def sir_fit_data(dates, data, s_init, i_init, r_init, moving_average=False, additional_label_text="", plot_color="b.-", time=100):
+    from matplotlib import pyplot as mpl
+    bootstrap_data = data
+    if moving_average:
+        bootstrap_data = three_day_average(bootstrap_data)
+    b,Sinit,S,I,R = sir_gradient_descent((s_init, i_init, r_init), time, (0.2,0.15), bootstrap_data)
+    mpl.plot(dates, I+R, plot_color + '.-', label="Predicted Cumulative Infections"+additional_label_text)
+    mpl.plot(dates, I, plot_color + ',-', label="Predicted Active Infections"+additional_label_text)
+    mpl.legend()
+    fig = mpl.gcf()
+    fig.set_size_inches(10, 7)
+    return b,Sinit,S,I,R
+
+
+def projection_cumulative_cases(population, cases, deaths, recovered, bootstrap_date, forecast_time=150, social_distancing_factor=0.9, logarithmic=False, state="KY"):
+    from matplotlib import pyplot as mpl
+    Sinit = population - cases[0] - recovered[0]
+    Iinit = cases[0] - deaths[0]
+    Rinit = recovered[0] + deaths[0]
+
+    date_list = [bootstrap_date + datetime.timedelta(days=x) for x in range(forecast_time)]
+    mpl.plot(date_list[:len(cases)], cases, 'ro', label="Reported Infections")
+
+    b,Sinit,S,I,R = sir_fit_data(date_list, cases, Sinit*(1-social_distancing_factor), Iinit, Rinit, time=forecast_time, additional_label_text=", " + str(social_distancing_factor*100) + "% social distancing", plot_color="C0")
+    mpl.title("%s Predicted infections over time \nUsing SIR model, β=%0.2f, γ=0.15"%(state,b))
+    mpl.grid(True)
+    if logarithmic:
+        mpl.gca().set_yscale("log")
+    mpl.show()
+    mpl.close()
+
+
+def projection_undertesting_cases(population, cases, deaths, recovered, bootstrap_date, forecast_time=150, social_distancing_factor=0.9, testing_coverage=0.2, logarithmic=False, state="KY"):
+    from matplotlib import pyplot as mpl
+    cumulative_infected = numpy.array(cases)/testing_coverage
+    Sinit = population - cumulative_infected[0] - (recovered[0]/testing_coverage)
+    Iinit = cumulative_infected[0] - deaths[0]
+    Rinit = recovered[0] + deaths[0]
+
+    date_list = [bootstrap_date + datetime.timedelta(days=x) for x in range(forecast_time)]
+    mpl.plot(date_list[:len(cumulative_infected)], cumulative_infected, 'ro', label="Estimated Infections")
+    mpl.plot(date_list[:len(cases)], cases, 'g-', label="Reported Infections")
+
+    b,Sinit,S,I,R = sir_fit_data(date_list, cumulative_infected, Sinit*(1-social_distancing_factor), Iinit, Rinit, time=forecast_time, additional_label_text=", " + str(social_distancing_factor*100) + "% social distancing", plot_color="C0")
+    mpl.title("%s Predicted infections over time assuming %d%% testing coverage\nUsing SIR model, β=%0.2f, γ=0.15"%(state,testing_coverage*100,b))
+    mpl.grid(True)
+    if logarithmic:
+        mpl.gca().set_yscale("log")
+    mpl.show()
+    mpl.close()
+
+
+def projection_deaths(population, deaths, recovered, bootstrap_date, forecast_time=150, social_distancing_factor=0.9, mortality_rate=0.05, logarithmic=False, state="KY"):
+    from matplotlib import pyplot as mpl
+    cumulative_infected = numpy.array(deaths)/mortality_rate
+    Sinit = population - cumulative_infected[0] - recovered[0]
+    Iinit = cumulative_infected[0] - deaths[0]
+    Rinit = recovered[0] + deaths[0]
+
+    date_list = [bootstrap_date + datetime.timedelta(days=x) for x in range(forecast_time)]
+    mpl.plot(date_list[:len(cumulative_infected)], cumulative_infected, 'ro', label="Estimated Infections")
+    mpl.plot(date_list[:len(deaths)], deaths, 'g-', label="Reported Deaths")
+
+    b,Sinit,S,I,R=sir_fit_data(date_list, cumulative_infected, Sinit*(1-social_distancing_factor), Iinit, Rinit, time=forecast_time, additional_label_text=", " + str(social_distancing_factor*100) + "% social distancing", plot_color="C0")
+    mpl.title("%s Predicted infections over time based on death count, assuming %.1f%% mortality\nUsing SIR model, β=%0.2f, γ=0.15"%(state,mortality_rate*100,b))
+    mpl.grid(True)
+    if logarithmic:
+        mpl.gca().set_yscale("log")
+    mpl.show()
+    mpl.close()
+
+def plot_projection_bands(bands, bootstrap_date, reported, label="Reported Infections", logarithmic=False):
+    from matplotlib import pyplot as mpl
+    date_list = [bootstrap_date + datetime.timedelta(days=x) for x in range(bands.bands.shape[1])]
+    mpl.plot(date_list[:len(reported)], reported, 'ro', label=label)
+    mpl.fill_between(date_list, bands.bands[0], bands.bands[-1], color="C0", alpha=0.3,
+                     label="%g-%g percentile of %d samples" % (bands.percentiles[0], bands.percentiles[-1], bands.samples))
+    mpl.plot(date_list, bands.band(50) if 50 in bands.percentiles else bands.bands[len(bands.bands) // 2], "C0-",
+             label="Median predicted cumulative infections")
+    mpl.title("Predicted infections over time (%s)\nUsing SIR model, β≈%0.2f, γ≈%0.2f" % (bands.kind, bands.fit['beta'], bands.fit['gamma']))
+    mpl.legend()
+    mpl.grid(True)
+    if logarithmic:
+        mpl.gca().set_yscale("log")
+    fig = mpl.gcf()
+    fig.set_size_inches(10, 7)
+    mpl.show()
+    mpl.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plot SIR projections for a state")
+    parser.add_argument("--state", default="KY")
+    parser.add_argument("--monte-carlo", type=int, default=None, metavar="SAMPLES",
+                        help="sample the inputs this many times and plot percentile bands instead")
+    parser.add_argument("--kind", default="undertesting", choices=PROJECTION_KINDS)
+    parser.add_argument("--processes", type=int, default=None)
+    args = parser.parse_args()
+    state = args.state
+    si = get_region_info()
+    pop = si.get_population(state)
+    data = get_historic(state).get_latest_n(45)
+    bootstrap_date = parse_date(data.dates[0])
+    positive = data['positive']
+    death = data['death']
+    recovered = data['recovered']
+
+    if args.monte_carlo:
+        for bands in monte_carlo_projection(args.kind, pop, positive, death, recovered, samples=args.monte_carlo,
+                                            processes=args.processes):
+            print("{n:d} samples in {t:.2f}s ({c:.1f} us/sample), bands moved {d}".format(
+                n=bands.samples, t=bands.wall_time, c=bands.cost_per_sample * 1e6,
+                d="-" if bands.change is None else "%.2f%%" % (bands.change * 100)))
+        plot_projection_bands(bands, bootstrap_date, death if args.kind == 'deaths' else positive,
+                              "Reported Deaths" if args.kind == 'deaths' else "Reported Infections")
+        sys.exit(0)
+
+    projection_cumulative_cases(pop, positive, death, recovered, bootstrap_date, social_distancing_factor=0.98, state=state)
+    projection_undertesting_cases(pop, positive, death, recovered, bootstrap_date, social_distancing_factor=0.985, testing_coverage=0.1, state=state)
+    projection_undertesting_cases(pop, positive, death, recovered, bootstrap_date, social_distancing_factor=0.98, testing_coverage=0.1, state=state)
+    projection_deaths(pop, death, recovered, bootstrap_date, social_distancing_factor=0.98, mortality_rate=0.02, state=state)
\ No newline at end of file
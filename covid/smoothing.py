@@ -0,0 +1,80 @@
+"""Smoothing and transforms of daily series, for one series or a whole states x days matrix.
+
+Every function works along the last axis, so a 1-D array is one series and each row of a 2-D array
+is one state. NaN marks a missing day and is left out of the averages instead of counted as zero.
+
+    smoothing.moving_average(matrix, 7, center=False)    # trailing 7-day average of every state
+    smoothing.moving_average(daily_difference(cumulative), 14)"""
+
+import numpy
+
+
+def _window_bounds(n, window, center):
+    """First and one-past-last index of the window around each day, clipped to the series"""
+    i = numpy.arange(n)
+    if center:
+        start = i - (window - 1) // 2
+        stop = i + window // 2 + 1
+    else:
+        start = i - window + 1
+        stop = i + 1
+    return numpy.clip(start, 0, n), numpy.clip(stop, 0, n)
+
+
+def moving_average(values, window=3, center=True):
+    """Average over window days, centered on each day or trailing it (the day and the window-1 before it).
+    Near the edges the window is cut short and the average is taken over the days it still covers,
+    like three_day_average always did. Days whose window holds no values are NaN."""
+    if window < 1:
+        raise ValueError("window must be at least 1")
+    values = numpy.asarray(values, dtype=numpy.float64)
+    n = values.shape[-1]
+    present = ~numpy.isnan(values)
+    # prefix sums with a leading zero, so the sum over [start, stop) is sums[stop] - sums[start]
+    pad = [(0, 0)] * (values.ndim - 1) + [(1, 0)]
+    sums = numpy.pad(numpy.cumsum(numpy.where(present, values, 0), axis=-1), pad)
+    counts = numpy.pad(numpy.cumsum(present, axis=-1), pad)
+    start, stop = _window_bounds(n, window, center)
+    total = sums[..., stop] - sums[..., start]
+    count = counts[..., stop] - counts[..., start]
+    with numpy.errstate(invalid='ignore', divide='ignore'):
+        return numpy.where(count > 0, total / count, numpy.nan)
+
+
+def exponential_smoothing(values, alpha=None, span=None):
+    """Exponentially weighted moving average s[t] = alpha * x[t] + (1 - alpha) * s[t-1], starting from
+    the first value. Give alpha directly or a span in days (alpha = 2 / (span + 1)). Missing days carry
+    the previous average forward."""
+    if alpha is None:
+        if span is None:
+            raise ValueError("give either alpha or span")
+        alpha = 2.0 / (span + 1)
+    if not 0 < alpha <= 1:
+        raise ValueError("alpha must be in (0, 1]")
+    values = numpy.asarray(values, dtype=numpy.float64)
+    smoothed = numpy.empty_like(values)
+    if values.shape[-1] == 0:
+        return smoothed
+    # one step per day across all rows at once; the recurrence itself cannot be vectorized over days
+    current = values[..., 0].copy()
+    smoothed[..., 0] = current
+    for t in range(1, values.shape[-1]):
+        x = values[..., t]
+        update = current + alpha * (x - current)
+        current = numpy.where(numpy.isnan(current), x, numpy.where(numpy.isnan(x), current, update))
+        smoothed[..., t] = current
+    return smoothed
+
+
+def daily_difference(cumulative, initial=numpy.nan, clip_negative=False):
+    """New counts per day from a cumulative series. The first day has no previous day and is set to
+    initial. Downward corrections upstream show as negative days unless clip_negative is set."""
+    cumulative = numpy.asarray(cumulative, dtype=numpy.float64)
+    daily = numpy.empty_like(cumulative)
+    if cumulative.shape[-1] == 0:
+        return daily
+    daily[..., 0] = initial
+    numpy.subtract(cumulative[..., 1:], cumulative[..., :-1], out=daily[..., 1:])
+    if clip_negative:
+        numpy.maximum(daily, 0, out=daily, where=~numpy.isnan(daily))
+    return daily
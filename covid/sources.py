@@ -0,0 +1,250 @@
+"""Where ingest downloads state histories from.
+
+A source has fetch(state, etag=None, last_modified=None) returning a fetch_response, and raises
+OSError when the source cannot be reached. Two are provided:
+
+    http_source      the covidtracking.com API layout, at COVID_API_BASE (or stub_server.py)
+    replay_source    histories replayed from a local snapshot archive, for offline operation and
+                     load tests, optionally growing a day at a time and with injected latency
+
+make_source() picks one from a spec string, by default from COVID_DATA_SOURCE:
+
+    http                                    the upstream API
+    http://127.0.0.1:8000                   the API layout at another address
+    replay:data/snapshot.zip                every archived day, served at once
+    replay:archive/?start=20200401&day_seconds=60&extrapolate=1&latency=0.2&jitter=0.1&fail_rate=0.01
+"""
+
+import json
+import os
+import random
+import re
+import tarfile
+import threading
+import time
+import zipfile
+from datetime import datetime, timedelta, timezone
+from email.utils import formatdate
+from urllib.parse import parse_qs
+
+import urllib3
+
+API_BASE = os.environ.get("COVID_API_BASE", "https://covidtracking.com")
+MAX_CONNECTIONS = int(os.environ.get("COVID_INGEST_WORKERS", 8))
+
+ARCHIVE_MEMBER = re.compile(r"(?:^|/)([A-Za-z0-9]+)_(?:historic|daily)\.json$")
+
+_default_http = None
+_default_http_lock = threading.Lock()
+
+
+class fetch_response:
+    """One answer from a source: status 200 with the JSON body, 304 when the validators still match,
+    or an error status. attempts counts retries made inside the source."""
+    def __init__(self, status, body=b"", etag=None, last_modified=None, attempts=1):
+        self.status = status
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.attempts = attempts
+
+
+class http_source:
+    """The covidtracking.com API, through one keep-alive pool that is safe to share between threads"""
+    def __init__(self, base=API_BASE, max_connections=MAX_CONNECTIONS):
+        self.base = base
+        self.pool = urllib3.PoolManager(
+            maxsize=max_connections,
+            timeout=urllib3.Timeout(connect=5.0, read=30.0),
+            retries=urllib3.Retry(total=3, backoff_factor=0.5, status_forcelist=(429, 500, 502, 503, 504),
+                                  raise_on_status=False))
+
+    def url(self, state):
+        return self.base + "/api/v1/states/" + state + "/daily.json"
+
+    def request(self, url, headers=None):
+        try:
+            return self.pool.request("GET", url, headers=headers)
+        except urllib3.exceptions.HTTPError as e:
+            raise OSError(type(e).__name__ + ": " + str(e))
+
+    def fetch(self, state, etag=None, last_modified=None):
+        headers = {}
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        response = self.request(self.url(state), headers)
+        attempts = 1 + (len(response.retries.history) if response.retries is not None else 0)
+        return fetch_response(response.status, response.data, response.headers.get('ETag'),
+                              response.headers.get('Last-Modified'), attempts)
+
+
+class replay_source:
+    """Serves state histories from a snapshot archive: a directory, .zip or .tar(.gz) holding
+    <ST>_historic.json or <ST>_daily.json files as saved by update_data or downloaded from upstream.
+
+    Only days up to the replay date are served. It starts at start (YYYYMMDD, default the last archived
+    day of each state) and moves forward a day every day_seconds of wall time, if given, and on advance().
+    With extrapolate, days past the end of the archive are made up by continuing each field's growth
+    over the last archived week. latency plus up to jitter seconds is slept before every answer, and
+    fail_rate of the requests are answered with 503."""
+    def __init__(self, archive, start=None, day_seconds=None, extrapolate=False, latency=0.0, jitter=0.0,
+                 fail_rate=0.0, seed=None):
+        self.archive = archive
+        self.start = start
+        self.day_seconds = day_seconds
+        self.extrapolate = extrapolate
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.rng = random.Random(seed)
+        self.started = time.monotonic()
+        self.advanced = 0
+        self._records = {}
+        self._members = self._list_members()
+
+    def _list_members(self):
+        if os.path.isdir(self.archive):
+            names = os.listdir(self.archive)
+        elif zipfile.is_zipfile(self.archive):
+            with zipfile.ZipFile(self.archive) as archive:
+                names = archive.namelist()
+        else:
+            with tarfile.open(self.archive) as archive:
+                names = archive.getnames()
+        members = {}
+        for name in sorted(names):
+            match = ARCHIVE_MEMBER.search(name)
+            if match is not None:
+                members.setdefault(match.group(1).upper(), name)
+        return members
+
+    def _read_member(self, name):
+        if os.path.isdir(self.archive):
+            with open(os.path.join(self.archive, name), 'rb') as fp:
+                return fp.read()
+        if zipfile.is_zipfile(self.archive):
+            with zipfile.ZipFile(self.archive) as archive:
+                return archive.read(name)
+        with tarfile.open(self.archive) as archive:
+            return archive.extractfile(name).read()
+
+    def states(self):
+        return list(self._members)
+
+    def records(self, state):
+        """Every archived day of a state, oldest first"""
+        records = self._records.get(state)
+        if records is None:
+            records = sorted(json.loads(self._read_member(self._members[state])), key=lambda x: x['date'])
+            self._records[state] = records
+        return records
+
+    def advance(self, days=1):
+        """Move the replay date forward"""
+        self.advanced += days
+
+    def elapsed_days(self):
+        days = self.advanced
+        if self.day_seconds:
+            days += int((time.monotonic() - self.started) / self.day_seconds)
+        return days
+
+    def visible(self, state):
+        """The days of a state that the replay has reached"""
+        records = self.records(state)
+        if not records:
+            return []
+        start = self.start if self.start is not None else records[-1]['date']
+        current = int((to_date(start) + timedelta(days=self.elapsed_days())).strftime("%Y%m%d"))
+        shown = [record for record in records if record['date'] <= current]
+        if self.extrapolate and current > records[-1]['date']:
+            shown += extrapolate_records(records, current)
+        return shown
+
+    def fetch(self, state, etag=None, last_modified=None):
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+        if self.fail_rate and self.rng.random() < self.fail_rate:
+            return fetch_response(503)
+        if state not in self._members:
+            return fetch_response(404)
+        records = self.visible(state)
+        last_date = records[-1]['date'] if records else 0
+        tag = '"%s-%d-%d"' % (state, last_date, len(records))
+        modified = formatdate(to_date(last_date).replace(tzinfo=timezone.utc).timestamp(), usegmt=True) if records else None
+        if etag == tag:
+            return fetch_response(304, etag=tag, last_modified=modified)
+        # newest first, like the upstream API
+        return fetch_response(200, json.dumps(records[::-1]).encode(), tag, modified)
+
+
+def to_date(date):
+    return datetime.strptime(str(int(date)), "%Y%m%d")
+
+
+def extrapolate_records(records, until):
+    """Made up days after the last record up to the date until. Every numeric field keeps growing from
+    its last reported value at its average daily rate over the last week of records (never shrinking),
+    so cumulative fields stay cumulative and a field missing from the last record is filled in."""
+    last = records[-1]
+    week = records[-8:]
+    first = {}
+    base = {}
+    for record in week:
+        for name, value in record.items():
+            if name != 'date' and isinstance(value, (int, float)) and not isinstance(value, bool):
+                first.setdefault(name, (to_date(record['date']), value))
+                base[name] = (to_date(record['date']), value)
+    growth = {}
+    for name, (first_day, first_value) in first.items():
+        base_day, base_value = base[name]
+        days = (base_day - first_day).days
+        if first_value > 0 and base_value > 0 and days > 0:
+            growth[name] = max((base_value / first_value) ** (1.0 / days), 1.0)
+        else:
+            growth[name] = 1.0
+    made_up = []
+    day = to_date(last['date'])
+    while True:
+        day += timedelta(days=1)
+        date = int(day.strftime("%Y%m%d"))
+        if date > until:
+            return made_up
+        record = dict(last, date=date)
+        for name, rate in growth.items():
+            # grown from the day the value was reported, not from the last record's date
+            base_day, base_value = base[name]
+            record[name] = int(round(base_value * rate ** (day - base_day).days))
+        made_up.append(record)
+
+
+def default_http_source():
+    """One http_source per process for callers that do not pass a source"""
+    global _default_http
+    with _default_http_lock:
+        if _default_http is None:
+            _default_http = http_source()
+        return _default_http
+
+
+def make_source(spec=None):
+    """A source from a spec string (see the module docstring), by default from COVID_DATA_SOURCE"""
+    if spec is None:
+        spec = os.environ.get("COVID_DATA_SOURCE", "http")
+    if spec == "http":
+        return default_http_source()
+    if spec.startswith("http://") or spec.startswith("https://"):
+        return http_source(spec.rstrip("/"))
+    if spec.startswith("replay:"):
+        path, _, query = spec[len("replay:"):].partition("?")
+        options = {name: values[-1] for name, values in parse_qs(query).items()}
+        known = {'start': int, 'day_seconds': float, 'extrapolate': lambda x: x in ('1', 'true', 'yes'),
+                 'latency': float, 'jitter': float, 'fail_rate': float, 'seed': int}
+        unknown = [name for name in options if name not in known]
+        if unknown:
+            raise ValueError("unknown replay option " + ", ".join(unknown) + ", expected one of " + ", ".join(known))
+        return replay_source(path, **{name: known[name](value) for name, value in options.items()})
+    raise ValueError("data source must be http, an http(s):// address or replay:<archive>, got " + spec)
@@ -0,0 +1,182 @@
+import json
+from datetime import datetime
+
+import numpy
+
+from . import historic_cache
+from . import metrics
+from . import smoothing
+
+class state_info:
+    def __init__(self, datafile = "data/states.json"):
+        with open(datafile,'r') as fp:
+            self.data = json.load(fp)
+
+    def get_states(self):
+        """Gets a list of two letter state codes present in states.json"""
+        return self.data.keys()
+
+    def get_name(self, state):
+        """Get the full name of the state from the two letter code"""
+        return self.data[state]['name']
+
+    def get_area(self, state):
+        """Get the area of a state"""
+        return self.data[state]['area']
+
+    def get_population(self, state):
+        """Get the population of a state (2019 estimate)"""
+        return self.data[state]['population']
+
+    def get_density(self, state):
+        """Get the calculated density of a state"""
+        return self.get_population(state)/self.get_area(state)
+
+class state_historic_data:
+    """Daily history of one state stored as columns: an integer date column and one float array per
+    numeric field. Missing values are stored as 0 and flagged False in the field's mask.
+    Any other region (see regions.py) passes its (dates, columns, masks) directly."""
+    def __init__(self, state, columns=None):
+        self.state = state
+        with metrics.timed('load', state):
+            # use the memory-mapped binary copy unless the JSON file is newer
+            if columns is None:
+                columns = historic_cache.lookup(state)
+            if columns is None:
+                columns = historic_cache.read_json(state)
+            self.dates, self.columns, self.masks = columns
+            # running maxima per field for threshold lookups, positive built up front as the common case
+            self._running_max = {}
+            self.running_max('positive')
+
+    def __len__(self):
+        return len(self.dates)
+
+    def column(self, name):
+        """Values of a field with missing days as 0. Fields the state never reported are all zeros."""
+        if name in self.columns:
+            return self.columns[name]
+        return numpy.zeros(len(self.dates))
+
+    def mask(self, name):
+        """True for the days that have a value for the field"""
+        if name in self.masks:
+            return self.masks[name]
+        return numpy.zeros(len(self.dates), dtype=bool)
+
+    def running_max(self, name):
+        """Highest value of a field reported on or before each day, -inf before the first report.
+        Never decreases, so the first day at or above any threshold is a binary search."""
+        running = self._running_max.get(name)
+        if running is None:
+            running = numpy.maximum.accumulate(numpy.where(self.mask(name), self.column(name), -numpy.inf))
+            self._running_max[name] = running
+        return running
+
+    def first_crossing(self, n, name='positive'):
+        """Index of the first day the field reaches n, or None if it never does"""
+        index = int(numpy.searchsorted(self.running_max(name), n, side='left'))
+        return index if index < len(self.dates) else None
+
+    def get_all(self):
+        return historic_view(self, 0, len(self.dates))
+
+    def get_latest(self):
+        return self.get_all().get_record(-1)
+
+    def get_latest_n(self, n):
+        start = len(self.dates) - n if 0 < n < len(self.dates) else 0
+        return historic_view(self, start, len(self.dates))
+
+    def get_date_range(self, begin, end):
+        """Get the data points with begin <= date <= end, dates given as YYYYMMDD integers"""
+        start = numpy.searchsorted(self.dates, begin, side='left')
+        stop = numpy.searchsorted(self.dates, end, side='right')
+        return historic_view(self, start, max(start, stop))
+
+    def get_after_n_cases(self, n, name='positive'):
+        """Get a set of data points after the state meets or exceeds the threshold number of cases (or of
+        another field). Starts at the first point where it meets the threshold, or the last point if none does"""
+        first_index = self.first_crossing(n, name)
+        if first_index is None:
+            first_index = max(len(self.dates) - 1, 0)
+        return historic_view(self, first_index, len(self.dates))
+
+    def get_moving_average(self, name, window, center=True):
+        """Moving average of a field over window days as a numpy array, missing days counted as 0"""
+        return smoothing.moving_average(self.get_all().filled(name, 0), window, center)
+
+    def get_three_day_case_average(self):
+        """Get a moving three day average of cases"""
+        return self.get_moving_average('positive', 3)
+
+    def get_three_day_death_average(self):
+        """Get a moving three day average of deaths"""
+        return self.get_moving_average('death', 3)
+
+
+class historic_view:
+    """A contiguous run of days from a state_historic_data. Columns are returned as numpy views into the
+    state's arrays, so taking a view costs nothing until a column is used.
+    view['positive'] gives a column, view[i:j] gives a narrower view."""
+    def __init__(self, history, start, stop):
+        self.history = history
+        self.state = history.state
+        self.start = start
+        self.stop = stop
+
+    def __len__(self):
+        return self.stop - self.start
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                raise ValueError("historic_view only supports contiguous slices")
+            return historic_view(self.history, self.start + start, self.start + max(start, stop))
+        return self.column(key)
+
+    @property
+    def dates(self):
+        return self.history.dates[self.start:self.stop]
+
+    def column(self, name):
+        return self.history.column(name)[self.start:self.stop]
+
+    def mask(self, name):
+        return self.history.mask(name)[self.start:self.stop]
+
+    def filled(self, name, fill):
+        """Values of a field with missing days replaced by fill (a copy, unlike column)"""
+        return numpy.where(self.mask(name), self.column(name), fill)
+
+    def get_record(self, index):
+        """One day as a dict of the fields present that day, like a row of the source JSON"""
+        i = range(self.start, self.stop)[index]
+        record = {'date': int(self.history.dates[i])}
+        for name, values in self.history.columns.items():
+            if self.history.masks[name][i]:
+                record[name] = values[i].item()
+        return record
+
+
+def crossing_dates(histories, thresholds, name='positive'):
+    """Date (YYYYMMDD) each history first reaches each threshold, as a histories x thresholds integer
+    array with 0 where it never does. Drives "days since the Nth case" alignments across states."""
+    thresholds = numpy.asarray(thresholds, dtype=numpy.float64)
+    dates = numpy.zeros((len(histories), len(thresholds)), dtype=numpy.int64)
+    for i, history in enumerate(histories):
+        index = numpy.searchsorted(history.running_max(name), thresholds, side='left')
+        reached = index < len(history.dates)
+        dates[i, reached] = history.dates[index[reached]]
+    return dates
+
+
+def parse_date(date):
+    """Convert a YYYYMMDD integer date into a datetime.date"""
+    return datetime.strptime(str(int(date)), "%Y%m%d").date()
+
+
+def three_day_average(array):
+    """Centered three day average, averaging only the two days present at either end"""
+    return smoothing.moving_average(array, 3).tolist()
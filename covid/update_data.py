@@ -0,0 +1,201 @@
+#!/usr/bin/python3
+
+import os
+import re
+import time
+import json
+from concurrent.futures import ThreadPoolExecutor
+from . import historic_cache
+from . import metrics
+from . import sources
+from .states import state_info
+
+API_BASE = sources.API_BASE
+MAX_WORKERS = int(os.environ.get("COVID_INGEST_WORKERS", 8))
+INGEST_STATE_FILE = "data/ingest_state.json"
+
+
+class ingest_result:
+    """Outcome of downloading one state: how long it took, how many attempts it needed, the dates it added
+    and the error if it failed. cache holds the last stored date and validators to send next time."""
+    def __init__(self, state, latency, attempts, error=None, new_dates=(), cache=None):
+        self.state = state
+        self.latency = latency
+        self.attempts = attempts
+        self.error = error
+        self.new_dates = list(new_dates)
+        self.cache = cache
+
+
+class ingest_report:
+    """Per-state results of one call to update_data"""
+    def __init__(self):
+        self.results = {}
+        self.elapsed = 0.0
+
+    def add(self, result):
+        self.results[result.state] = result
+
+    def failures(self):
+        return {state: result.error for state, result in self.results.items() if result.error is not None}
+
+    def changeset(self):
+        """Map of state to the dates added by this update, for states that changed"""
+        return {state: result.new_dates for state, result in self.results.items() if result.new_dates}
+
+    def summary(self):
+        lines = ["Fetched %d states in %.2fs, %d changed, %d failed" % (len(self.results), self.elapsed,
+                                                                         len(self.changeset()), len(self.failures()))]
+        for state, result in sorted(self.results.items()):
+            line = "%s,%.3f,%d,%d" % (state, result.latency, result.attempts, len(result.new_dates))
+            if result.error is not None:
+                line += "," + result.error
+            lines.append(line)
+        return "\n".join(lines)
+
+
+def get_state_current(state):
+    return get_api(API_BASE + "/api/v1/states/"+state+"/current.json")
+
+def get_state_historic(state):
+    return get_api(state_historic_url(state))
+
+def state_historic_url(state):
+    return sources.default_http_source().url(state)
+
+@metrics.timed_function('ingest.get_api')
+def get_api(url):
+    request = sources.default_http_source().request(url)
+    if request.status == 200:
+        response = json.loads(request.data)
+    else:
+        print("ERROR: Could not read API data, got status " + str(request.status) + " " + request.reason)
+        response = {}
+    return response
+
+def fetch_state(state, cache=None, source=None):
+    """Download the history of one state from source (see sources.py, default make_source()) and store
+    any days newer than the ones already saved. cache is the state's entry from the ingest state file;
+    its validators are sent so an unchanged state costs a 304 and no parsing. Never raises; failures
+    are recorded in the result."""
+    start = time.perf_counter()
+    name = state + "_historic"
+    if source is None:
+        source = sources.make_source()
+    if cache is None or not os.path.exists("data/" + name + ".json"):
+        cache = {}
+
+    attempts = 1
+    error = None
+    new_dates = []
+    try:
+        with metrics.timed('ingest.get_api', state):
+            request = source.fetch(state, cache.get('etag'), cache.get('last_modified'))
+        attempts = request.attempts
+        if request.status == 200:
+            data = json.loads(request.body)
+            if not isinstance(data, list):
+                raise ValueError("expected a JSON array of days, got " + type(data).__name__)
+            with metrics.timed('ingest.save_data', state):
+                if 'last_date' in cache:
+                    # the file says what is stored: an ingest cut short after appending leaves the ingest state behind
+                    last_date = stored_last_date(name)
+                    new_rows = sorted(filter(lambda x: x['date'] > last_date, data), key=lambda x: x['date'])
+                    append_data(name, new_rows)
+                else:
+                    last_date = 0
+                    new_rows = data
+                    save_data(name, data)
+            new_dates = sorted(x['date'] for x in new_rows)
+            cache = {'last_date': max([last_date] + new_dates),
+                     'etag': request.etag,
+                     'last_modified': request.last_modified}
+        elif request.status != 304:
+            error = "HTTP " + str(request.status)
+    except (ValueError, KeyError, TypeError, OSError) as e:
+        error = type(e).__name__ + ": " + str(e)
+    return ingest_result(state, time.perf_counter() - start, attempts, error, new_dates, cache)
+
+def save_data(name,data):
+    """Write data sorted by date. The file is written under a temporary name and then renamed over
+    the old one so readers never see a partially written file."""
+    sorted_data = sorted(data, key=lambda x: x['date'])
+    path = "data/" + name + ".json"
+    with open(path + ".tmp","w") as fp:
+        json.dump(sorted_data,fp)
+    os.replace(path + ".tmp", path)
+
+def stored_last_date(name):
+    """Date of the last row of a file written by save_data, read from the end of the file"""
+    path = "data/" + name + ".json"
+    with open(path, "rb") as fp:
+        fp.seek(0, os.SEEK_END)
+        fp.seek(max(fp.tell() - 4096, 0))
+        dates = re.findall(rb'"date": *(\d+)', fp.read())
+    if dates:
+        return int(dates[-1])
+    with open(path, "r") as fp:
+        return max([row['date'] for row in json.load(fp)] + [0])
+
+def append_data(name, rows):
+    """Append rows, already sorted by date, to a file written by save_data without parsing the rows
+    already stored. Like save_data the extended array is written under a temporary name and renamed
+    over the old file, so readers and an interrupted append never leave a partial array behind."""
+    if not rows:
+        return
+    encoded = ", ".join(json.dumps(row) for row in rows).encode()
+    path = "data/" + name + ".json"
+    with open(path, "rb") as fp:
+        stored = fp.read().rstrip()
+    if not stored.endswith(b"]"):
+        raise ValueError(path + " does not end with a JSON array")
+    # step back over the closing bracket of the stored array
+    stored = stored[:-1]
+    empty = stored.rstrip().endswith(b"[")
+    with open(path + ".tmp", "wb") as fp:
+        fp.write(stored + (b"" if empty else b", ") + encoded + b"]")
+    os.replace(path + ".tmp", path)
+
+def load_ingest_state():
+    """Last stored date and HTTP validators per state, as saved by the previous update"""
+    try:
+        with open(INGEST_STATE_FILE, 'r') as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return {}
+
+def save_ingest_state(ingest_state):
+    with open(INGEST_STATE_FILE + ".tmp", "w") as fp:
+        json.dump(ingest_state, fp)
+    os.replace(INGEST_STATE_FILE + ".tmp", INGEST_STATE_FILE)
+
+def update_data(max_workers=MAX_WORKERS, source=None):
+    """Download every state concurrently from source (default make_source()), append new days, refresh
+    the binary cache and return an ingest_report whose changeset() lists the dates added per state.
+    A state that fails keeps its previously saved data."""
+    if source is None:
+        source = sources.make_source()
+    si = state_info()
+    ingest_state = load_ingest_state()
+    report = ingest_report()
+    start = time.perf_counter()
+    states = list(si.get_states())
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for result in executor.map(fetch_state, states, [ingest_state.get(state) for state in states],
+                                       [source] * len(states)):
+                report.add(result)
+                metrics.get_counter("ingest_results_total", "Ingest outcomes per state", ('state', 'outcome')).inc(
+                    (result.state, "error" if result.error else ("changed" if result.new_dates else "unchanged")))
+                if result.error is None:
+                    ingest_state[result.state] = result.cache
+    finally:
+        # keep what finished even if the ingest is cut short
+        save_ingest_state(ingest_state)
+    historic_cache.update_cache(states)
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+if __name__ == "__main__":
+    print(update_data().summary())
@@ -0,0 +1,135 @@
+"""Rendered chart images keyed by their normalized parameters and the data versions of their states.
+
+A key changes whenever any input of the chart changes, so cached bytes never need invalidating and
+the key doubles as a strong ETag. Bytes are kept in a size-bounded in-memory LRU in front of a
+size-bounded directory on disk, evicting the least recently used images first."""
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from covid import metrics
+from covid.calculate_trends import data_version
+from covid.registry import get_historic
+
+CHART_DIR = "data/charts"
+MEMORY_LIMIT = int(os.environ.get("COVID_CHART_MEMORY_BYTES", 32 * 1024 * 1024))
+DISK_LIMIT = int(os.environ.get("COVID_CHART_DISK_BYTES", 256 * 1024 * 1024))
+
+
+def chart_columns(kind, options):
+    """The columns a chart of this kind reads, which are the ones its data version has to cover"""
+    if kind in ('trend', 'growth'):
+        return (options.get('data_name', 'positive'),)
+    if kind == 'pos_test_rate':
+        return ('positive', 'total')
+    if kind == 'mortality_rate':
+        return ('death', 'positive')
+    raise ValueError("unknown chart " + kind)
+
+
+def chart_key(kind, states, options):
+    """Hash of the chart parameters and the current version of the columns it reads for every state in it"""
+    columns = chart_columns(kind, options)
+    versions = [data_version(get_historic(state).get_all(), columns) for state in states]
+    key = json.dumps([kind, list(states), options, versions], sort_keys=True).encode()
+    return hashlib.sha256(key).hexdigest()
+
+
+class chart_cache:
+    """PNG bytes by chart_key, with hit/miss counters"""
+    def __init__(self, directory=CHART_DIR, memory_limit=MEMORY_LIMIT, disk_limit=DISK_LIMIT):
+        self.directory = directory
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        # matplotlib is not thread-safe, so one chart is rendered at a time
+        self._render_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get(self, key, render):
+        """Bytes of the chart with this key, calling render() to produce them on a miss"""
+        body = self._lookup(key)
+        if body is not None:
+            return body
+        with self._render_lock:
+            # another request may have rendered the same chart while this one waited
+            body = self._lookup(key, count=False)
+            if body is None:
+                self.misses += 1
+                body = render()
+                self._store(key, body)
+        return body
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".png")
+
+    def _lookup(self, key, count=True):
+        with self._lock:
+            body = self._memory.get(key)
+            if body is not None:
+                self._memory.move_to_end(key)
+                if count:
+                    self.hits += 1
+                return body
+        try:
+            with open(self._path(key), "rb") as fp:
+                body = fp.read()
+            # bump the mtime so the disk eviction order follows use, not creation
+            os.utime(self._path(key))
+        except OSError:
+            return None
+        self._remember(key, body)
+        if count:
+            self.hits += 1
+        return body
+
+    def _remember(self, key, body):
+        with self._lock:
+            if key not in self._memory:
+                self._memory[key] = body
+                self._memory_bytes += len(body)
+            while self._memory_bytes > self.memory_limit and self._memory:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _store(self, key, body):
+        self._remember(key, body)
+        path = self._path(key)
+        with open(path + ".tmp", "wb") as fp:
+            fp.write(body)
+        os.replace(path + ".tmp", path)
+        self._trim_disk()
+
+    def _trim_disk(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".png"):
+                stat = os.stat(os.path.join(self.directory, name))
+                files.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in files)
+        for _, size, name in sorted(files):
+            if total <= self.disk_limit:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                pass
+            total -= size
+
+
+def render_png(kind, states, options):
+    """Render a chart to PNG bytes"""
+    # matplotlib is only loaded once the first chart is requested
+    from covid import render_charts
+    buffer = io.BytesIO()
+    with metrics.timed('render.' + kind):
+        render_charts.render_figure(kind, states, options, buffer)
+    return buffer.getvalue()
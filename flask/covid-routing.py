@@ -1,14 +1,165 @@
 import json
+import math
+import os
+import sys
+import time
+from datetime import datetime, timezone
 
-import requests
-from flask import Flask
-import calculate_trends
-import update_data
+# the covid package lives next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask, Response, g, request
+import chart_cache
+from covid import metrics
+from covid import projections
+from covid import rankings
+import refresh
+import series
+from covid.registry import get_region_info, get_state_info, get_historic
+from covid.states import parse_date
 
 
 
 app = Flask(__name__)
 
+scheduler = refresh.refresh_scheduler()
+# under gunicorn the refresh runs in its own process (see gunicorn.conf.py) and workers only read snapshots
+if os.environ.get("COVID_REFRESH_IN_PROCESS", "1") != "0":
+    scheduler.start()
+
+# readiness fails when upstream has not been checked successfully for this long
+MAX_DATA_AGE = float(os.environ.get("COVID_MAX_DATA_AGE", 3 * scheduler.interval))
+
+charts = chart_cache.chart_cache()
+
+# ?profile=1 or an X-Profile header returns a sampled profile of the request instead of its response
+PROFILING_ENABLED = os.environ.get("COVID_PROFILING_ENABLED", "0") == "1"
+
+DATA_NAMES = ('positive', 'negative', 'death', 'total', 'recovered', 'hospitalized')
+
+# query parameters accepted by each chart kind, mapped to (plot function argument, parser)
+CHART_OPTIONS = {
+    'trend': {'data': ('data_name', str), 'trendline': ('trendline', 'bool'), 'logarithmic': ('logarithmic', 'bool'),
+              'pop_adjusted': ('pop_adjusted', 'bool'), 'days': ('days', int)},
+    'growth': {'data': ('data_name', str), 'logarithmic': ('logarithmic', 'bool'), 'threshold': ('threshold', int)},
+    'pos_test_rate': {'threshold': ('threshold', float), 'days': ('days', int)},
+    'mortality_rate': {'threshold': ('threshold', float), 'days': ('days', int)},
+}
+
+
+def json_error(message, status, headers=None):
+    return Response(json.dumps({'error': message}), status=status, headers=headers, mimetype='application/json')
+
+
+def parse_bool(value):
+    if value.lower() in ('1', 'true', 'yes'):
+        return True
+    if value.lower() in ('0', 'false', 'no'):
+        return False
+    raise ValueError("expected a boolean, got " + value)
+
+
+def parse_chart_options(kind, args):
+    """Keyword arguments for the plot function from the query string, in a canonical form for cache keys"""
+    options = {}
+    for name, (argument, parser) in CHART_OPTIONS[kind].items():
+        if name in args:
+            value = args[name]
+            options[argument] = parse_bool(value) if parser == 'bool' else parser(value)
+    if options.get('data_name', 'positive') not in DATA_NAMES:
+        raise ValueError("data must be one of " + ", ".join(DATA_NAMES))
+    return options
+
+
+def preload_data():
+    """Load every state into the registry. Under gunicorn this runs once in the master before the workers
+    are forked, so they start warm and share the loaded pages."""
+    for state in get_state_info().get_states():
+        try:
+            get_historic(state)
+        except OSError:
+            pass
+    scheduler.current()
+
+
+def freshness():
+    snapshot = scheduler.current()
+    status = {'ready': False, 'updated': None, 'checked': None, 'age_seconds': None,
+              'max_age_seconds': MAX_DATA_AGE, 'latest_date': None, 'pid': os.getpid()}
+    if snapshot is not None:
+        age = (datetime.now(timezone.utc) - snapshot.checked).total_seconds()
+        latest = [int(get_historic(state).dates[-1]) for state in available_states(get_state_info().get_states())
+                  if len(get_historic(state)) > 0]
+        status.update(ready=age <= MAX_DATA_AGE, updated=snapshot.updated.isoformat(),
+                      checked=snapshot.checked.isoformat(), age_seconds=age,
+                      latest_date=max(latest) if latest else None)
+    return status
+
+
+def parse_series_args(args):
+    """(fields, begin, end) from the fields, from and to query parameters"""
+    fields = [field.strip() for field in args.get('fields', '').split(',') if field.strip()]
+    if not fields:
+        fields = list(series.DEFAULT_FIELDS)
+    if not all(field.isalnum() for field in fields):
+        raise ValueError("fields must be a comma separated list of field names")
+    begin = int(args.get('from', 0))
+    end = int(args.get('to', 99999999))
+    for date in (args.get('from'), args.get('to')):
+        if date is not None:
+            parse_date(date)
+    return fields, begin, end
+
+
+def stream_series(states, args):
+    try:
+        fields, begin, end = parse_series_args(args)
+    except ValueError as e:
+        return json_error(str(e), 400)
+    chunks = series.series_chunks(states, fields, begin, end)
+    if 'gzip' in request.accept_encodings:
+        response = Response(series.gzip_chunks(chunks), mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(chunks, mimetype='application/json')
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def available_states(states):
+    """The states whose history can be loaded, checked before streaming so a response cannot fail halfway"""
+    available = []
+    for state in states:
+        try:
+            get_historic(state)
+            available.append(state)
+        except OSError:
+            pass
+    return available
+
+
+@app.before_request
+def start_request():
+    g.request_start = time.perf_counter()
+    g.profiler = None
+    if PROFILING_ENABLED and (request.args.get('profile') == '1' or 'X-Profile' in request.headers):
+        g.profiler = metrics.sampling_profiler()
+        g.profiler.start()
+
+
+@app.after_request
+def finish_request(response):
+    endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    metrics.get_histogram("http_request_seconds", "Time to produce a response, excluding streamed bodies",
+                          ('endpoint',)).observe(time.perf_counter() - g.request_start, (endpoint,))
+    metrics.get_counter("http_responses_total", "Responses by endpoint and status",
+                        ('endpoint', 'status')).inc((endpoint, str(response.status_code)))
+    metrics.maybe_write_snapshot()
+    if g.profiler is not None:
+        g.profiler.stop()
+        return Response(g.profiler.collapsed(), mimetype='text/plain')
+    return response
+
 
 @app.route("/")
 @app.route("/root")
@@ -16,8 +167,140 @@ app = Flask(__name__)
 @app.route("/home")
 @app.route("/trends", methods=['GET'])
 def root():
-    update_data.update_data()
-    return json.dumps(calculate_trends.calculate_trends())
+    snapshot = scheduler.current()
+    if snapshot is None:
+        return json_error('trends have not been computed yet', 503, {'Retry-After': '30'})
+    output = dict(snapshot.trends, updated=snapshot.updated.isoformat())
+    with metrics.timed('serialize'):
+        body = json.dumps(output)
+    response = Response(body, mimetype='application/json')
+    response.last_modified = snapshot.updated
+    return response
+
+
+@app.route("/health", methods=['GET'])
+def health():
+    """Liveness: always 200 while the process can answer, with the state of its data"""
+    return Response(json.dumps(freshness()), mimetype='application/json')
+
+
+@app.route("/ready", methods=['GET'])
+def ready():
+    """Readiness: 503 until trends exist and while upstream has not been checked within MAX_DATA_AGE"""
+    status = freshness()
+    return Response(json.dumps(status), status=200 if status['ready'] else 503, mimetype='application/json')
+
+
+@app.route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    """Prometheus metrics summed over every worker followed by those the refresh process last wrote"""
+    output = metrics.render(directory=metrics.MULTIPROCESS_DIR)
+    try:
+        with open(refresh.METRICS_FILE, 'r') as fp:
+            output += fp.read()
+    except OSError:
+        pass
+    return Response(output, mimetype='text/plain; version=0.0.4')
+
+
+@app.route("/charts/<kind>", methods=['GET'])
+def chart(kind):
+    if kind not in CHART_OPTIONS:
+        return json_error('unknown chart ' + kind + ', expected one of ' + ", ".join(CHART_OPTIONS), 404)
+    states = []
+    for state in request.args.get('states', '').upper().split(','):
+        if state.strip() and state.strip() not in states:
+            states.append(state.strip())
+    unknown = [state for state in states if not get_region_info().has_region(state)]
+    if not states or unknown:
+        return json_error('states must be a comma separated list of known states or region IDs', 400)
+    try:
+        options = parse_chart_options(kind, request.args)
+    except ValueError as e:
+        return json_error(str(e), 400)
+    if options.get('pop_adjusted'):
+        unknown = [state for state in states if not math.isfinite(get_region_info().get_population(state))]
+        if unknown:
+            return json_error('population unknown for ' + ",".join(unknown) + ', pop_adjusted needs it', 400)
+
+    try:
+        key = chart_cache.chart_key(kind, states, options)
+    except OSError:
+        return json_error('no data available yet for ' + ",".join(states), 503, {'Retry-After': '30'})
+    if key in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = Response(charts.get(key, lambda: chart_cache.render_png(kind, states, options)), mimetype='image/png')
+    response.set_etag(key)
+    # clients may keep the image but must revalidate, which is a cheap 304 until the data changes
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+@app.route("/rankings", methods=['GET'])
+def state_rankings():
+    """Every state (or county with level=county) ranked on each metric; metric, states, top and window
+    narrow the tables"""
+    level = request.args.get('level', 'state')
+    if level not in ('state', 'county'):
+        return json_error('level must be state or county', 400)
+    known = get_region_info().get_regions(level)
+    states = [state.strip() for state in request.args.get('states', '').upper().split(',') if state.strip()]
+    if any(not get_region_info().has_region(state) for state in states):
+        return json_error('states must be a comma separated list of known states or region IDs', 400)
+    metric_names = [name.strip() for name in request.args.get('metric', '').split(',') if name.strip()] or None
+    try:
+        top = int(request.args['top']) if 'top' in request.args else None
+        window = int(request.args.get('window', 7))
+        if window < 2 or (top is not None and top < 1):
+            raise ValueError("window must be at least 2 and top at least 1")
+        output = rankings.state_rankings(available_states(states or known), metric_names, top, window)
+    except (ValueError, KeyError) as e:
+        return json_error(str(e), 400)
+    return Response(json.dumps(output), mimetype='application/json')
+
+
+@app.route("/projections/<state>", methods=['GET'])
+def state_projections(state):
+    """Precomputed SIR projection bands of a state (see covid/projections.py), flagged stale when newer
+    data has arrived and running while a job is recomputing them; kind narrows the projection kinds"""
+    state = state.upper()
+    if state not in get_state_info().get_states():
+        return json_error('unknown state ' + state, 404)
+    kinds = [kind.strip() for kind in request.args.get('kind', '').split(',') if kind.strip()] or None
+    output = projections.get_projection(state, kinds)
+    if output is None:
+        running = projections.read_status().get('running', False)
+        message = 'projections for ' + state + (' are being computed' if running else ' have not been computed yet')
+        return json_error(message, 503, {'Retry-After': '30'})
+    response = Response(json.dumps(output), mimetype='application/json')
+    response.last_modified = datetime.fromisoformat(output['computed'])
+    return response
+
+
+@app.route("/states/<state>/series", methods=['GET'])
+@app.route("/regions/<state>/series", methods=['GET'])
+def state_series(state):
+    state = state.upper()
+    if not get_region_info().has_region(state):
+        return json_error('unknown state ' + state, 404)
+    if not available_states([state]):
+        return json_error('no data available yet for ' + state, 503, {'Retry-After': '30'})
+    return stream_series([state], request.args)
+
+
+@app.route("/series", methods=['GET'])
+def all_series():
+    """Series for the states (or any region IDs) in the states query parameter, or every state"""
+    states = [state.strip() for state in request.args.get('states', '').upper().split(',') if state.strip()]
+    if not states:
+        states = list(get_state_info().get_states())
+    elif any(not get_region_info().has_region(state) for state in states):
+        return json_error('states must be a comma separated list of known states or region IDs', 400)
+    return stream_series(available_states(states), request.args)
+
+preload_data()
 
 if __name__ == '__main__':
-    app.run(debug=True, host='0.0.0.0')
+    # the reloader would import this module twice and start a second refresh thread
+    app.run(debug=True, host='0.0.0.0', use_reloader=False)
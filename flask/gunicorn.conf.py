@@ -0,0 +1,68 @@
+"""Production serving profile: gunicorn -c gunicorn.conf.py covid-routing:app
+
+The app is imported once in the master (preload_app) so every worker starts with the data already
+loaded and shares those pages copy-on-write and through the memory-mapped history cache. Upstream
+refreshes run in one separate process started here; workers notice the snapshot and data files it
+writes on their next request, so new data is served without restarting anything. Each worker saves
+its metrics to data/metrics every few seconds and /metrics adds up all of them, whichever worker
+answers. Send SIGHUP to the master to roll the workers gracefully after a code change."""
+
+import multiprocessing
+import os
+import subprocess
+import sys
+
+# the covid package lives next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# workers must not start their own refresh threads; the refresher process below does the refreshing
+os.environ["COVID_REFRESH_IN_PROCESS"] = "0"
+os.environ.setdefault("COVID_METRICS_DIR", "data/metrics")
+
+bind = "0.0.0.0:" + os.environ.get("PORT", "5000")
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count() * 2 + 1))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 4))
+preload_app = True
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+max_requests = 10000
+max_requests_jitter = 1000
+accesslog = "-"
+
+refresher = None
+
+
+def on_starting(server):
+    from covid import metrics
+    metrics.clear_snapshots(os.environ["COVID_METRICS_DIR"])
+
+
+def when_ready(server):
+    global refresher
+    # the data preloaded into the master is timed once, under the master's pid
+    from covid import metrics
+    metrics.write_snapshot(os.environ["COVID_METRICS_DIR"])
+    refresher = subprocess.Popen([sys.executable, "refresh.py"])
+    server.log.info("Started refresh process %d", refresher.pid)
+
+
+def post_fork(server, worker):
+    from covid import metrics
+    metrics.reset()
+
+
+def worker_exit(server, worker):
+    # keep the final counts of a worker recycled by max_requests, so the totals do not go backwards
+    from covid import metrics
+    try:
+        metrics.write_snapshot(os.environ["COVID_METRICS_DIR"])
+    except OSError as e:
+        server.log.warning("Could not save metrics of worker %d: %s", worker.pid, e)
+
+
+def on_exit(server):
+    if refresher is not None:
+        refresher.terminate()
+        refresher.wait(timeout=10)
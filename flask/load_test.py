@@ -0,0 +1,57 @@
+#!/usr/bin/python3
+"""Measure latency percentiles and throughput of an endpoint, e.g.
+    python load_test.py --url http://localhost:5000/trends --concurrency 16 --duration 30"""
+
+import argparse
+import threading
+import time
+
+import numpy
+import urllib3
+
+
+def run_client(http, url, deadline, latencies, errors):
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            response = http.request("GET", url, retries=False)
+            if response.status >= 400:
+                errors.append(response.status)
+                continue
+        except urllib3.exceptions.HTTPError as e:
+            errors.append(type(e).__name__)
+            continue
+        latencies.append(time.perf_counter() - start)
+
+
+def load_test(url, concurrency=8, duration=10.0):
+    """Hit url from concurrency keep-alive clients for duration seconds; returns a dict of results"""
+    http = urllib3.PoolManager(maxsize=concurrency)
+    latencies = []
+    errors = []
+    deadline = time.perf_counter() + duration
+    clients = [threading.Thread(target=run_client, args=(http, url, deadline, latencies, errors))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+    latencies = numpy.array(latencies) * 1000
+    return {'url': url, 'concurrency': concurrency, 'requests': len(latencies), 'errors': len(errors),
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': float(numpy.percentile(latencies, 50)) if len(latencies) else None,
+            'p99_ms': float(numpy.percentile(latencies, 99)) if len(latencies) else None}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test an endpoint")
+    parser.add_argument("--url", default="http://localhost:5000/trends")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0)
+    args = parser.parse_args()
+    result = load_test(args.url, args.concurrency, args.duration)
+    print("%(requests)d requests, %(errors)d errors, %(requests_per_second).1f req/s" % result)
+    if result['requests']:
+        print("p50 %(p50_ms).2f ms, p99 %(p99_ms).2f ms" % result)
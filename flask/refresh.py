@@ -0,0 +1,177 @@
+import json
+import os
+import sys
+import threading
+from datetime import datetime, timezone
+
+# the covid package lives next to this directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from covid import calculate_trends
+from covid import metrics
+from covid import registry
+
+SNAPSHOT_FILE = "data/trends_snapshot.json"
+METRICS_FILE = "data/metrics_refresh.prom"
+REFRESH_NAMESPACE = "covid_refresh"
+
+
+class trend_snapshot:
+    """The trends computed by one refresh together with the time the underlying data was fetched
+    and the time upstream was last checked. Snapshots are never modified after creation, so readers
+    can use one without locking."""
+    def __init__(self, trends, updated, checked=None):
+        self.trends = trends
+        self.updated = updated
+        self.checked = updated if checked is None else checked
+
+
+class refresh_scheduler:
+    """Refreshes upstream data and recomputes trends on a background thread.
+    Only one refresh runs at a time; requests read the latest snapshot and never wait on a refresh.
+
+    Every new snapshot is also written to SNAPSHOT_FILE. Processes that do not run the refresh
+    themselves (the gunicorn workers) pick up new snapshots from that file through current().
+    After each refresh the projections of states with new data are recomputed on another thread."""
+    def __init__(self, interval=None, metrics_file=None, source=None, projections=None):
+        if interval is None:
+            interval = float(os.environ.get("COVID_REFRESH_INTERVAL", 3600))
+        if projections is None:
+            projections = os.environ.get("COVID_PROJECTIONS", "1") != "0"
+        self.interval = interval
+        # recompute stale SIR projections (see covid/projections.py) after every successful refresh
+        self.projections = projections
+        self.metrics_file = metrics_file
+        # created on the first refresh (see covid/sources.py), so a replay keeps its clock across refreshes
+        self.source = source
+        self.snapshot = None
+        self._snapshot_mtime = None
+        self._refresh_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._projection_lock = threading.Lock()
+        self._projection_thread = None
+        self._projections_pending = False
+
+    def start(self):
+        """Start the background refresh thread if it is not already running"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="covid-refresh", daemon=True)
+            self._thread.start()
+
+    def current(self):
+        """The latest snapshot, reloaded from SNAPSHOT_FILE if another process has written a newer one"""
+        try:
+            mtime = os.stat(SNAPSHOT_FILE).st_mtime_ns
+        except OSError:
+            return self.snapshot
+        if mtime != self._snapshot_mtime:
+            try:
+                with open(SNAPSHOT_FILE, 'r') as fp:
+                    saved = json.load(fp)
+                self.snapshot = trend_snapshot(saved['trends'], datetime.fromisoformat(saved['updated']),
+                                               datetime.fromisoformat(saved['checked']))
+                self._snapshot_mtime = mtime
+            except (OSError, ValueError, KeyError) as e:
+                print("ERROR: could not read " + SNAPSHOT_FILE + ": " + str(e))
+        return self.snapshot
+
+    def set_snapshot(self, snapshot):
+        """Swap in a new snapshot and save it for the other processes"""
+        self.snapshot = snapshot
+        with open(SNAPSHOT_FILE + ".tmp", "w") as fp:
+            json.dump({'trends': snapshot.trends, 'updated': snapshot.updated.isoformat(),
+                       'checked': snapshot.checked.isoformat()}, fp)
+        os.replace(SNAPSHOT_FILE + ".tmp", SNAPSHOT_FILE)
+        self._snapshot_mtime = os.stat(SNAPSHOT_FILE).st_mtime_ns
+
+    def start_projections(self):
+        """Recompute stale projections on a background thread. If a job is already running it goes
+        round once more when it finishes, so data refreshed in the meantime is not missed."""
+        with self._projection_lock:
+            self._projections_pending = True
+            if self._projection_thread is None:
+                self._projection_thread = threading.Thread(target=self._run_projections, name="covid-projections",
+                                                           daemon=True)
+                self._projection_thread.start()
+
+    def _run_projections(self):
+        # imported here so web workers that only serve stored projections never load the SIR model
+        from covid import projections
+        while True:
+            with self._projection_lock:
+                if not self._projections_pending:
+                    self._projection_thread = None
+                    return
+                self._projections_pending = False
+            try:
+                projections.precompute_projections(only_stale=True)
+            except Exception as e:
+                print("ERROR: projections failed: " + repr(e))
+
+    def trigger(self):
+        """Ask the background thread to refresh now instead of waiting for the interval to pass"""
+        self._wakeup.set()
+
+    def load_existing(self):
+        """Compute trends from the data files already on disk so requests can be served before the first refresh"""
+        try:
+            trends = calculate_trends.calculate_trends()
+            updated = max(os.path.getmtime("data/" + state + "_historic.json") for state in trends['case7'])
+        except (OSError, ValueError) as e:
+            print("No existing data to serve before the first refresh: " + str(e))
+            return False
+        self.set_snapshot(trend_snapshot(trends, datetime.fromtimestamp(updated, timezone.utc)))
+        return True
+
+    def refresh(self):
+        """Download new data and recompute trends, then swap in the new snapshot.
+        Returns False without doing anything if another refresh is already running."""
+        if not self._refresh_lock.acquire(blocking=False):
+            return False
+        try:
+            # imported here so web workers that only read snapshots never load the HTTP client
+            from covid import sources, update_data
+            if self.source is None:
+                self.source = sources.make_source()
+            report = update_data.update_data(source=self.source)
+            if report.failures():
+                print(report.summary())
+            if len(report.failures()) == len(report.results):
+                # upstream was not checked successfully, so checked must not move and readiness can lapse
+                print("ERROR: refresh failed for every state, keeping previous data")
+                return False
+            changeset = report.changeset()
+            if self.snapshot is not None and not changeset:
+                # nothing new upstream, the current trends are still up to date
+                self.set_snapshot(trend_snapshot(self.snapshot.trends, self.snapshot.updated, datetime.now(timezone.utc)))
+            else:
+                registry.registry.invalidate(changeset)
+                trends = calculate_trends.calculate_trends()
+                self.set_snapshot(trend_snapshot(trends, datetime.now(timezone.utc)))
+            if self.projections:
+                self.start_projections()
+            return True
+        except Exception as e:
+            # keep serving the previous snapshot until a later refresh succeeds
+            print("ERROR: refresh failed, keeping previous data: " + repr(e))
+            return False
+        finally:
+            self._refresh_lock.release()
+            if self.metrics_file:
+                metrics.write_metrics_file(self.metrics_file, REFRESH_NAMESPACE)
+
+    def run_forever(self):
+        """Refresh every interval in the calling thread"""
+        if self.current() is None:
+            self.load_existing()
+        while True:
+            self.refresh()
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+
+if __name__ == "__main__":
+    # run the refresh on its own, for deployments where the web workers only read snapshots;
+    # its timings are left in METRICS_FILE for the workers to include in /metrics
+    refresh_scheduler(metrics_file=METRICS_FILE).run_forever()
@@ -0,0 +1,47 @@
+"""Streaming JSON encoding of per-state time series.
+
+Output is produced a state at a time from the in-memory columns, so a response covering every state
+is never built as a whole."""
+
+import json
+import zlib
+
+import numpy
+
+from covid.registry import get_historic
+
+DEFAULT_FIELDS = ('positive', 'death', 'total')
+
+
+def column_values(values, mask):
+    """JSON list of a column with missing days as null and whole numbers written without a fraction"""
+    if numpy.all(values == numpy.floor(values)):
+        values = values.astype(numpy.int64)
+    return json.dumps([value if present else None for value, present in zip(values.tolist(), mask.tolist())])
+
+
+def state_series(state, fields, begin, end):
+    """JSON object for one state: its dates from begin to end and one list per field"""
+    data = get_historic(state).get_date_range(begin, end)
+    parts = ['{"state": ' + json.dumps(state), '"date": ' + json.dumps(data.dates.tolist())]
+    for field in fields:
+        parts.append(json.dumps(field) + ": " + column_values(data.column(field), data.mask(field)))
+    return ", ".join(parts) + "}"
+
+
+def series_chunks(states, fields, begin, end):
+    """Chunks of {"series": [...]} with one object per state"""
+    yield '{"fields": ' + json.dumps(list(fields)) + ', "series": ['
+    for i, state in enumerate(states):
+        yield (", " if i > 0 else "") + state_series(state, fields, begin, end)
+    yield ']}'
+
+
+def gzip_chunks(chunks):
+    """Gzip a stream of text chunks, flushing the compressor after each so a slow stream still moves"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode()) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,88 @@
+#!/usr/bin/python3
+"""Local stand-in for the covidtracking.com API so ingest can be exercised offline.
+
+Serves a covid.sources.replay_source of a directory or archive of <ST>_historic.json (or
+<ST>_daily.json) files on both URL layouts the ingest has used (covid/sources.py uses the first), with
+an ETag that changes with the days served so conditional requests get a 304 until new days appear:
+    /api/v1/states/<st>/daily.json
+    /api/states/daily?state=<ST>
+
+Point the ingest at it with COVID_API_BASE=http://localhost:8000, or skip HTTP altogether with
+COVID_DATA_SOURCE=replay:<archive>
+"""
+
+import argparse
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from covid.sources import replay_source
+
+V1_DAILY = re.compile(r"^/api/v1/states/([A-Za-z0-9]+)/daily\.json$")
+
+
+def make_handler(data_dir, latency=0.0, fail_rate=0.0, source=None):
+    """Request handler answering from source, by default a replay of data_dir with the given latency and fail rate"""
+    if source is None:
+        source = replay_source(data_dir, latency=latency, fail_rate=fail_rate)
+
+    class stub_handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            match = V1_DAILY.match(url.path)
+            if match is not None:
+                state = match.group(1).upper()
+            elif url.path == "/api/states/daily":
+                state = parse_qs(url.query).get("state", [""])[0].upper()
+            else:
+                self.send_error(404)
+                return
+
+            response = source.fetch(state, self.headers.get("If-None-Match"), self.headers.get("If-Modified-Since"))
+            if response.status not in (200, 304):
+                self.send_error(response.status)
+                return
+            self.send_response(response.status)
+            if response.status == 200:
+                self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(response.body)))
+            if response.etag:
+                self.send_header("ETag", response.etag)
+            if response.last_modified:
+                self.send_header("Last-Modified", response.last_modified)
+            self.end_headers()
+            self.wfile.write(response.body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return stub_handler
+
+
+def start_stub_server(data_dir, port=0, latency=0.0, fail_rate=0.0, source=None):
+    """Start the stub server on a background thread and return it. Use port 0 to pick a free port;
+    the chosen one is in server.server_address."""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(data_dir, latency, fail_rate, source))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve canned daily.json payloads for offline ingest")
+    parser.add_argument("--data-dir", default="data", help="directory, .zip or .tar.gz of <ST>_historic.json files")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds to wait before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="up to this many extra seconds per response")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument("--start", type=int, default=None, help="replay from this YYYYMMDD date")
+    parser.add_argument("--day-seconds", type=float, default=None, help="advance the replay a day this often")
+    parser.add_argument("--extrapolate", action="store_true", help="keep growing past the end of the data")
+    args = parser.parse_args()
+    source = replay_source(args.data_dir, args.start, args.day_seconds, args.extrapolate, args.latency, args.jitter, args.fail_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(args.data_dir, source=source))
+    print("Serving " + args.data_dir + " on http://127.0.0.1:" + str(args.port))
+    server.serve_forever()
@@ -0,0 +1,139 @@
+#!/usr/bin/python3
+"""Write realistic synthetic <ST>_historic.json files so everything can be run and measured offline.
+
+Each state follows a logistic epidemic curve with daily noise. Cumulative fields never decrease and
+fields go missing (null) at a configurable rate, as they did in the real upstream data. Counties are
+written as one CSV in the county format covid.regions imports, with their populations in regions.json."""
+
+import argparse
+import csv
+import json
+import os
+from datetime import date, timedelta
+
+import numpy
+
+FIELDS = ('positive', 'negative', 'total', 'death', 'recovered', 'hospitalized')
+
+
+def synthetic_states(count, existing=None):
+    """states.json entries for count states: the existing entries first, then made-up ones"""
+    states = dict(list((existing or {}).items())[:count])
+    i = 0
+    while len(states) < count:
+        code = "S" + str(i)
+        if code not in states:
+            states[code] = {'name': "Synthetic " + code, 'area': 10000 + 1000 * i, 'population': 1000000 + 250000 * i}
+        i += 1
+    return states
+
+
+def synthetic_history(state, population, days, missing_rate=0.05, start=date(2020, 3, 1), rng=None):
+    """List of daily records for one state, sorted by date like save_data writes them"""
+    rng = numpy.random.default_rng() if rng is None else rng
+    t = numpy.arange(days)
+    ceiling = population * rng.uniform(0.002, 0.02)
+    midpoint = rng.uniform(days * 0.3, days * 0.8)
+    growth = rng.uniform(0.08, 0.25)
+    expected = ceiling / (1 + numpy.exp(-growth * (t - midpoint)))
+    positive = numpy.maximum.accumulate(numpy.round(expected * rng.uniform(0.9, 1.1, days)) + 1)
+    tested_ratio = rng.uniform(5, 20)
+    negative = numpy.maximum.accumulate(numpy.round(positive * tested_ratio * rng.uniform(0.95, 1.05, days)))
+    death = numpy.maximum.accumulate(numpy.round(numpy.concatenate(([0] * 10, positive[:-10])) * rng.uniform(0.01, 0.06)))
+    recovered = numpy.maximum.accumulate(numpy.round(numpy.concatenate(([0] * 14, positive[:-14])) * 0.8))
+    hospitalized = numpy.maximum.accumulate(numpy.round(positive * rng.uniform(0.05, 0.15)))
+    values = {'positive': positive, 'negative': negative, 'total': positive + negative, 'death': death,
+              'recovered': recovered, 'hospitalized': hospitalized}
+
+    records = []
+    for day in range(days):
+        record = {'date': int((start + timedelta(days=day)).strftime("%Y%m%d")), 'state': state}
+        for field in FIELDS:
+            missing = rng.random() < missing_rate or (field != 'positive' and values[field][day] == 0)
+            record[field] = None if missing else int(values[field][day])
+        record['hash'] = "%040x" % rng.integers(0, 2 ** 63)
+        records.append(record)
+    return records
+
+
+def write_synthetic_data(data_dir="data", states=None, count=None, days=120, missing_rate=0.05, seed=0):
+    """Write histories for the given state codes, or for count states (made up beyond those in
+    data_dir/states.json, which is extended only if it has fewer). Returns the list of state codes written."""
+    os.makedirs(data_dir, exist_ok=True)
+    info_path = os.path.join(data_dir, "states.json")
+    try:
+        with open(info_path, 'r') as fp:
+            info = json.load(fp)
+    except (OSError, ValueError):
+        info = {}
+    if states is None:
+        count = len(info) if count is None else count
+        if count > len(info):
+            info = synthetic_states(count, info)
+            with open(info_path, 'w') as fp:
+                json.dump(info, fp, indent=2)
+        states = list(info)[:count]
+
+    rng = numpy.random.default_rng(seed)
+    for state in states:
+        population = info[state]['population'] if state in info else 5000000
+        with open(os.path.join(data_dir, state + "_historic.json"), 'w') as fp:
+            json.dump(synthetic_history(state, population, days, missing_rate, rng=rng), fp)
+    return states
+
+
+def write_synthetic_counties(data_dir="data", count=3000, days=120, missing_rate=0.05, seed=0):
+    """Write count counties spread over the states in data_dir/states.json to data_dir/us-counties.csv
+    (date, county, state, fips, cases, deaths) and their names and populations to data_dir/regions.json.
+    Returns the path of the CSV."""
+    with open(os.path.join(data_dir, "states.json"), 'r') as fp:
+        info = json.load(fp)
+    states = list(info)
+    rng = numpy.random.default_rng(seed)
+    t = numpy.arange(days)
+    dates = [(date(2020, 3, 1) + timedelta(days=day)).isoformat() for day in range(days)]
+
+    regions_path = os.path.join(data_dir, "regions.json")
+    try:
+        with open(regions_path, 'r') as fp:
+            regions = json.load(fp)
+    except (OSError, ValueError):
+        regions = {}
+    path = os.path.join(data_dir, "us-counties.csv")
+    with open(path, 'w', newline='') as fp:
+        writer = csv.writer(fp)
+        writer.writerow(['date', 'county', 'state', 'fips', 'cases', 'deaths'])
+        for i in range(count):
+            state = states[i % len(states)]
+            fips = "%05d" % ((i % len(states) + 1) * 1000 + i // len(states) + 1)
+            population = int(rng.lognormal(10.5, 1.2))
+            ceiling = population * rng.uniform(0.002, 0.02)
+            expected = ceiling / (1 + numpy.exp(-rng.uniform(0.08, 0.25) * (t - rng.uniform(days * 0.3, days * 0.8))))
+            cases = numpy.maximum.accumulate(numpy.round(expected * rng.uniform(0.9, 1.1, days)))
+            deaths = numpy.maximum.accumulate(numpy.round(cases * rng.uniform(0.01, 0.06)))
+            missing = rng.random((2, days)) < missing_rate
+            name = "County " + str(i)
+            for day in numpy.flatnonzero(cases > 0):
+                writer.writerow([dates[day], name, info[state]['name'], fips,
+                                 "" if missing[0, day] else int(cases[day]), "" if missing[1, day] else int(deaths[day])])
+            regions[state + "-" + fips] = {'name': name, 'population': population}
+    with open(regions_path, 'w') as fp:
+        json.dump(regions, fp, indent=2)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic state histories")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--states", default=None, help="comma separated state codes (default: every state in states.json)")
+    parser.add_argument("--count", type=int, default=None, help="number of states, adding made-up ones to states.json")
+    parser.add_argument("--days", type=int, default=120)
+    parser.add_argument("--missing-rate", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--counties", type=int, default=0, help="also write this many counties to us-counties.csv")
+    args = parser.parse_args()
+    states = args.states.split(",") if args.states else None
+    written = write_synthetic_data(args.data_dir, states, args.count, args.days, args.missing_rate, args.seed)
+    print("Wrote " + str(len(written)) + " states x " + str(args.days) + " days to " + args.data_dir)
+    if args.counties:
+        print("Wrote " + str(args.counties) + " counties to " + write_synthetic_counties(args.data_dir, args.counties, args.days, args.missing_rate, args.seed))